@@ -10,7 +10,14 @@ login_manager = LoginManager()
 def load_user(id):
     return User.query.get(int(id))
 
-def create_app():
+def create_app(start_async_processor=True):
+    """
+    Create the Flask application.
+    
+    Args:
+        start_async_processor: Start the workers of the async request queue in this process;
+            scripts that only run a task pass False
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
     
@@ -30,8 +37,9 @@ def create_app():
     app.register_blueprint(main)
     
     # Start the AsyncProcessor for background processing
-    from app.async_processor import AsyncProcessor
-    async_processor = AsyncProcessor(app)
-    async_processor.start()
+    if start_async_processor and Config.ASYNC_WORKERS > 0:
+        from app.async_processor import AsyncProcessor
+        async_processor = AsyncProcessor(app, Config.ASYNC_WORKERS)
+        async_processor.start()
     
     return app
\ No newline at end of file
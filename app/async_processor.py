@@ -1,15 +1,28 @@
+import os
+import socket
 import threading
-from app.audio_processor import process_audio_requests
+from app.audio_processor import process_async_requests
+from app.request_queue import RequestListener
 
 class AsyncProcessor:
-    def __init__(self, app):
+    """
+    Runs `workers` threads that each claim and process async requests from the queue, and a
+    listener that wakes them when requests are enqueued.
+    """
+
+    def __init__(self, app, workers=1):
         self.app = app
-        self.thread = threading.Thread(target=self.run)
-        self.thread.daemon = True
+        self.listener = RequestListener(app)
+        self.threads = [
+            threading.Thread(target=self.run, args=(f"{socket.gethostname()}:{os.getpid()}-{index}",), name=f"async-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
 
     def start(self):
-        self.thread.start()
+        self.listener.start()
+        for thread in self.threads:
+            thread.start()
 
-    def run(self):
+    def run(self, worker):
         with self.app.app_context():
-            process_audio_requests() 
\ No newline at end of file
+            process_async_requests(worker, self.listener.listening)
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+
+from app.models import AsyncProcessingRequest, Email, ReadStatus, db
+from app.request_queue import HIGH_PRIORITY
+from config import Config
+
+
+class AudioDemandScorer:
+    """
+    Predicts how likely a user is to play the audio of an email, from their history with its
+    newsletter.
+
+    The score of a newsletter is the smoothed share of its recent emails the user listened to,
+    with emails they only read counting for Config.AUDIO_DEMAND_READ_WEIGHT of a listen. Newsletters
+    without history get the prior, Config.AUDIO_DEMAND_PRIOR_LISTENS out of
+    Config.AUDIO_DEMAND_PRIOR_EMAILS.
+    """
+
+    def __init__(self, user_id: int, days: int = None):
+        self.user_id = user_id
+        self.days = days or Config.AUDIO_DEMAND_HISTORY_DAYS
+        self._newsletters = None
+
+    def _history(self) -> dict:
+        """
+        Emails delivered, read and listened to per newsletter over the history window.
+        
+        Emails of the last day, which the user may not have had time to open yet, are left out.
+        """
+        now = datetime.now()
+        emails = db.session.query(Email.id, Email.name).filter(
+            Email.user_id == self.user_id,
+            Email.created_at >= now - timedelta(days=self.days),
+            Email.created_at < now - timedelta(days=1)
+        ).all()
+        statuses = db.session.query(ReadStatus.item_id, ReadStatus.item_type).filter(
+            ReadStatus.user_id == self.user_id,
+            ReadStatus.item_type.in_(['email', 'email_audio']),
+            ReadStatus.item_id.in_([email.id for email in emails])
+        ).all()
+        read = {status.item_id for status in statuses if status.item_type == 'email'}
+        listened = {status.item_id for status in statuses if status.item_type == 'email_audio'}
+
+        newsletters = defaultdict(lambda: {'emails': 0, 'read': 0, 'listened': 0})
+        for email in emails:
+            history = newsletters[email.name]
+            history['emails'] += 1
+            if email.id in listened:
+                history['listened'] += 1
+            elif email.id in read:
+                history['read'] += 1
+        return newsletters
+
+    def score(self, email: Email) -> float:
+        """Estimated probability, between 0 and 1, that the user plays the audio of the email."""
+        if self._newsletters is None:
+            self._newsletters = self._history()
+        history = self._newsletters.get(email.name, {'emails': 0, 'read': 0, 'listened': 0})
+        interest = history['listened'] + Config.AUDIO_DEMAND_READ_WEIGHT * history['read']
+        return (interest + Config.AUDIO_DEMAND_PRIOR_LISTENS) / (history['emails'] + Config.AUDIO_DEMAND_PRIOR_EMAILS)
+
+
+def estimated_tts_cost(email: Email) -> float:
+    """Rough text-to-speech cost of the audio of an email, in dollars, from its length."""
+    return len(email.to_md()) * Config.TTS_COST_PER_MILLION_CHARS / 1_000_000
+
+
+def on_demand_hit_rate(days: int = None) -> tuple[int, int]:
+    """
+    How many of the emails listened to over the last `days` had their audio ready, rather than
+    generated after the user asked for it.
+
+    Returns:
+        tuple[int, int]: emails listened to with pre-rendered audio, and emails listened to
+    """
+    since = datetime.now() - timedelta(days=days or Config.AUDIO_DEMAND_HISTORY_DAYS)
+    listened = {row.item_id for row in db.session.query(ReadStatus.item_id).filter(
+        ReadStatus.item_type == 'email_audio',
+        ReadStatus.read_at >= since
+    )}
+    if not listened:
+        return 0, 0
+    # Audio a user asked for is queued in the high-priority lane, also when the request was
+    # queued by the pre-rendering and promoted before it ran
+    requested = {row.email_id for row in db.session.query(AsyncProcessingRequest.email_id).filter(
+        AsyncProcessingRequest.type == 'audio',
+        AsyncProcessingRequest.priority == HIGH_PRIORITY,
+        AsyncProcessingRequest.email_id.in_(listened)
+    )}
+    return len(listened - requested), len(listened)
+
+
+def select_emails_to_prerender(emails: list[Email]) -> tuple[list[Email], list[Email]]:
+    """Split emails into the ones worth pre-rendering audio for and the ones left for on demand."""
+    scorers = {}
+    prerender, skipped = [], []
+    for email in emails:
+        scorer = scorers.setdefault(email.user_id, AudioDemandScorer(email.user_id))
+        score = scorer.score(email)
+        (prerender if score >= Config.AUDIO_PRERENDER_THRESHOLD else skipped).append(email)
+        logging.debug(f"Audio demand score of email {email.id} ({email.name}): {score:.2f}")
+    return prerender, skipped
@@ -1,40 +1,296 @@
+from datetime import datetime, timedelta
+import threading
 import time
-from app.models import db, AsyncProcessingRequest, Email
+from sqlalchemy import or_, update
+from app import audio_stream, speech_formatter
+from app.audio_renditions import store_audio
+from app.models import db, AsyncProcessingRequest, AudioFile, Email
+from app.request_queue import wait_for_requests, wakeup
 from app.voice_generator import VoiceClipGenerator
+from app.summary_generator import SummaryGenerator
+from config import Config
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
 
-def process_audio_requests():
+def process_audio_request(request) -> bool:
+    """Generate the audio for the email of an 'audio' request."""
+    email = Email.query.get(request.email_id)
+    if not email:
+        return False
+
+    # Generate audio
+    voice_generator = VoiceClipGenerator()
+    success = voice_generator.email_to_audio(email, stream=True)
+    if success:
+        email.has_audio = True
+        email.audio_creation_state = 'completed'
+    return success
+
+
+def process_summary_request(request) -> bool:
+    """Fill in the pending summary of a 'summary' request, recording its progress on the request."""
+    summary = request.summary
+    if not summary:
+        return False
+
+    progress = []
+    _record_progress(request, progress)
+    summary_generator = SummaryGenerator()
+    for event, data in summary_generator.generate_summary_events(summary.user_id, summary):
+        progress.append([event, data])
+        _record_progress(request, progress)
+    return True
+
+
+def _record_progress(request: AsyncProcessingRequest, progress: list):
+    """
+    Save the progress events of a request while its worker still holds it.
+
+    Saved on its own connection, so that it is visible before the handler's session is committed.
+    """
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(AsyncProcessingRequest).where(
+                AsyncProcessingRequest.id == request.id,
+                AsyncProcessingRequest.worker == request.worker,
+                AsyncProcessingRequest.status == 'started'
+            ).values(progress=progress)
+        )
+
+
+def process_summary_audio_request(request) -> bool:
+    """Generate the audio of the summary of a 'summary_audio' request, queued by the summary audio backfill."""
+    summary = request.summary
+    if not summary:
+        return False
+    if summary.has_audio:
+        return True
+
+    if not summary.audio_text:
+        # Convert summary content to audio-friendly format
+        if Config.AUDIO_SCRIPT_MODE == 'rules':
+            summary.audio_text = speech_formatter.format_summary(summary)
+        else:
+            summary.audio_text = SummaryGenerator().convert_to_audio_format(str(summary), content_type='summary')
+        db.session.commit()
+        logging.info(f"Converted summary {summary.id} to speech text")
+
+    logging.info(f"Generating audio file for summary {summary.id}")
+    voice_data, section_index = VoiceClipGenerator().text_to_speech_indexed(summary.audio_text, content_type="speech_summary")
+    if not voice_data:
+        logging.info(f"Failed to generate audio for summary {summary.id}")
+        return False
+
+    audio_filename = f"summary_{summary.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
+    audio_file = AudioFile.query.filter_by(summary_id=summary.id).first()
+    if audio_file:
+        audio_file.filename = audio_filename
+    else:
+        audio_file = AudioFile(filename=audio_filename, summary_id=summary.id)
+        db.session.add(audio_file)
+    store_audio(audio_file, voice_data, section_index)
+    summary.has_audio = True
+    logging.info(f"Successfully generated audio for summary {summary.id}")
+    return True
+
+
+# Handlers for each AsyncProcessingRequest.type
+REQUEST_HANDLERS = {
+    'audio': process_audio_request,
+    'summary': process_summary_request,
+    'summary_audio': process_summary_audio_request,
+}
+
+
+def claim_request(worker: str, low_priority_first: bool = False) -> AsyncProcessingRequest | None:
+    """
+    Atomically claim the oldest pending request of the highest priority, or of the lowest
+    priority when `low_priority_first`, or return None when there is none.
+    
+    The row is locked with FOR UPDATE SKIP LOCKED, so concurrent workers, in this or other
+    processes, never claim the same request and do not wait on each other's locks. The status
+    is only changed if the request is still pending, which also holds on databases without
+    row locks.
+    
+    The claim is a lease of Config.ASYNC_LEASE_SECONDS, renewed by a Heartbeat while the
+    request runs; requests whose lease expires are taken back by `reap_expired_requests`.
+    """
+    request = AsyncProcessingRequest.query.filter(
+        AsyncProcessingRequest.status == 'pending',
+        AsyncProcessingRequest.type.in_(REQUEST_HANDLERS.keys())
+    ).order_by(
+        AsyncProcessingRequest.priority.asc() if low_priority_first else AsyncProcessingRequest.priority.desc(),
+        AsyncProcessingRequest.created_at,
+        AsyncProcessingRequest.id
+    ).with_for_update(skip_locked=True).limit(1).first()
+    if not request:
+        db.session.commit()
+        return None
+
+    now = datetime.now()
+    claimed = AsyncProcessingRequest.query.filter_by(id=request.id, status='pending').update(
+        {
+            'status': 'started',
+            'worker': worker,
+            'started_at': now,
+            'lease_expires_at': now + timedelta(seconds=Config.ASYNC_LEASE_SECONDS),
+            'attempts': AsyncProcessingRequest.attempts + 1,
+        },
+        synchronize_session='fetch'
+    )
+    db.session.commit()
+    return request if claimed else None
+
+
+class Heartbeat:
+    """Renews the lease of a claimed request every Config.ASYNC_HEARTBEAT_INTERVAL seconds while it runs."""
+
+    def __init__(self, request_id: int, worker: str):
+        self.request_id = request_id
+        self.worker = worker
+        # Renewals use their own connections, outside of the handler's session
+        self.engine = db.engine
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"heartbeat-{request_id}", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self._stopped.wait(Config.ASYNC_HEARTBEAT_INTERVAL):
+            try:
+                with self.engine.begin() as connection:
+                    renewed = connection.execute(
+                        update(AsyncProcessingRequest).where(
+                            AsyncProcessingRequest.id == self.request_id,
+                            AsyncProcessingRequest.worker == self.worker,
+                            AsyncProcessingRequest.status == 'started'
+                        ).values(lease_expires_at=datetime.now() + timedelta(seconds=Config.ASYNC_LEASE_SECONDS))
+                    ).rowcount
+            except Exception as e:
+                logging.warning(f"Could not renew the lease of request {self.request_id}: {str(e)}")
+                continue
+            if not renewed:
+                logging.warning(f"Worker {self.worker} lost the lease of request {self.request_id}")
+                return
+
+
+def _release_target(request: AsyncProcessingRequest):
+    """Let the email or summary of a request that failed for good be requested again."""
+    if request.type == 'audio' and request.email:
+        request.email.audio_creation_state = 'none'
+        audio_stream.remove_stream('email', request.email_id)
+    if request.type == 'summary' and request.summary:
+        request.summary.status = 'failed'
+
+
+def run_request(request: AsyncProcessingRequest, worker: str):
+    """
+    Run the handler of a claimed request and record its outcome in one transaction.
+    
+    The outcome is only recorded while the worker still holds the request: if its lease expired
+    and the request was taken back, the worker that runs it next records the outcome.
+    """
+    request_id = request.id
+    request_type = request.type
+    handler = REQUEST_HANDLERS[request_type]
+    with Heartbeat(request_id, worker):
+        try:
+            success = handler(request)
+            error_message = None
+        except Exception as e:
+            logging.error(f"Error processing {request_type} request {request_id}: {str(e)}")
+            db.session.rollback()
+            success, error_message = False, str(e)
+
+    # Update request status
+    finished = AsyncProcessingRequest.query.filter_by(id=request_id, worker=worker, status='started').update(
+        {
+            'status': 'completed' if success else 'failed',
+            'error_message': error_message,
+            'completed_at': datetime.now(),
+            'lease_expires_at': None,
+        },
+        synchronize_session='fetch'
+    )
+    if not finished:
+        logging.warning(f"Request {request_id} was taken back from worker {worker}, not recording its outcome")
+    elif not success:
+        _release_target(db.session.get(AsyncProcessingRequest, request_id))
+    db.session.commit()
+
+
+def reap_expired_requests() -> int:
+    """
+    Take back started requests whose lease expired, e.g. because their worker died.
+    
+    They are queued again, or failed once they were attempted Config.ASYNC_MAX_ATTEMPTS times.
+    Returns the number of requests taken back.
+    """
+    now = datetime.now()
+    expired = AsyncProcessingRequest.query.filter(
+        AsyncProcessingRequest.status == 'started',
+        or_(AsyncProcessingRequest.lease_expires_at < now, AsyncProcessingRequest.lease_expires_at.is_(None))
+    ).with_for_update(skip_locked=True).all()
+    for request in expired:
+        if request.attempts >= Config.ASYNC_MAX_ATTEMPTS:
+            logging.error(f"Failing {request.type} request {request.id}: its lease expired on all {request.attempts} attempts")
+            request.status = 'failed'
+            request.error_message = f"Worker stopped responding on all {request.attempts} attempts"
+            request.completed_at = now
+            _release_target(request)
+        else:
+            logging.warning(f"Requeuing {request.type} request {request.id}: the lease of worker {request.worker} expired")
+            request.status = 'pending'
+            if request.type == 'audio':
+                # The expired worker stops writing once its stream is gone
+                audio_stream.remove_stream('email', request.email_id)
+        request.worker = None
+        request.lease_expires_at = None
+    db.session.commit()
+    if expired:
+        wakeup.set()
+    return len(expired)
+
+
+def process_async_requests(worker: str = 'worker', listening: bool = False):
+    """
+    Claim and process requests one at a time, taking back expired requests every
+    Config.ASYNC_REAP_INTERVAL seconds.
+    
+    High-priority requests are claimed first, except every Config.ASYNC_LOW_PRIORITY_EVERY-th
+    claim, which takes the oldest low-priority request so batch work keeps progressing.
+    
+    When the queue is empty, wait until a request is enqueued; `listening` tells whether
+    notifications from other processes arrive, or the queue must be polled (see app.request_queue).
+    """
+    next_reap = 0
+    claims = 0
     while True:
-        # Fetch pending audio requests
-        pending_requests = AsyncProcessingRequest.query.filter_by(status='pending', type='audio').all()
-
-        for request in pending_requests:
-            email = Email.query.get(request.email_id)
-            if email:
-                try:
-                    # Update request status to 'started'
-                    request.status = 'started'
-                    db.session.commit()
-
-                    # Generate audio
-                    voice_generator = VoiceClipGenerator()
-                    success = voice_generator.email_to_audio(email)
-
-                    # Update request and email status
-                    if success:
-                        request.status = 'completed'
-                        email.has_audio = True
-                    else:
-                        request.status = 'failed'
-
-                    db.session.commit()
-                except Exception as e:
-                    logging.error(f"Error processing audio request for email {email.id}: {str(e)}")
-                    request.status = 'failed'
-                    db.session.commit()
-
-        # Sleep for a while before checking again
-        time.sleep(10) 
\ No newline at end of file
+        try:
+            if time.monotonic() >= next_reap:
+                reap_expired_requests()
+                next_reap = time.monotonic() + Config.ASYNC_REAP_INTERVAL
+            low_priority_first = claims % Config.ASYNC_LOW_PRIORITY_EVERY == Config.ASYNC_LOW_PRIORITY_EVERY - 1
+            request = claim_request(worker, low_priority_first)
+            if request:
+                claims += 1
+                logging.info(f"Worker {worker} processing {request.type} request {request.id} (priority {request.priority})")
+                run_request(request, worker)
+        except Exception as e:
+            logging.error(f"Worker {worker} failed to process the queue: {str(e)}")
+            db.session.rollback()
+            request = None
+        finally:
+            # Start every request with a fresh session
+            db.session.remove()
+
+        if not request:
+            wait_for_requests(listening)
@@ -0,0 +1,83 @@
+import io
+import logging
+
+from pydub import AudioSegment
+
+from app.audio_storage import get_audio_storage
+from app.models import AudioFile, AudioRendition
+from config import Config
+
+
+def transcode(data: bytes, settings: dict) -> bytes:
+    """Re-encode MP3 audio with the format, bitrate, channels and sample rate of a rendition."""
+    audio = AudioSegment.from_mp3(io.BytesIO(data))
+    if settings.get('channels'):
+        audio = audio.set_channels(settings['channels'])
+    if settings.get('sample_rate'):
+        audio = audio.set_frame_rate(settings['sample_rate'])
+    buffer = io.BytesIO()
+    audio.export(buffer, format=settings['format'], bitrate=settings['bitrate'], codec=settings.get('codec'))
+    return buffer.getvalue()
+
+
+def _describe(audio_file: AudioFile) -> str:
+    """What the audio file is of, for logs: new files have no id until they are flushed."""
+    if audio_file.email_id:
+        return f"the audio of email {audio_file.email_id}"
+    if audio_file.summary_id:
+        return f"the audio of summary {audio_file.summary_id}"
+    return f"audio file {audio_file.id or audio_file.filename}"
+
+
+def create_renditions(audio_file: AudioFile, data: bytes = None) -> list[AudioRendition]:
+    """
+    Create the renditions of `Config.AUDIO_RENDITIONS` that the audio file does not have yet.
+
+    A rendition that fails to encode (e.g. ffmpeg is missing) is skipped and logged; the
+    original audio is always served in its place. The caller commits the session.
+    """
+    existing = {rendition.name for rendition in audio_file.renditions}
+    missing = [name for name in Config.AUDIO_RENDITIONS if name not in existing]
+    if not missing:
+        return []
+
+    data = data if data is not None else audio_file.read_audio()
+    storage = get_audio_storage()
+    created = []
+    for name in missing:
+        settings = Config.AUDIO_RENDITIONS[name]
+        try:
+            encoded = transcode(data, settings)
+        except Exception as e:
+            logging.warning(f"Could not create the {name} rendition of {_describe(audio_file)}: {e}")
+            continue
+        rendition = AudioRendition(
+            name=name,
+            mimetype=settings['mimetype'],
+            storage_key=storage.put(encoded),
+            size=len(encoded),
+            digest=storage.digest(encoded)
+        )
+        audio_file.renditions.append(rendition)
+        created.append(rendition)
+        logging.info(f"Created the {name} rendition of {_describe(audio_file)}: {len(encoded)} bytes, {len(data)} originally")
+    return created
+
+
+def store_audio(audio_file: AudioFile, data: bytes, section_index: list[dict] = None):
+    """Store the audio of the file with its section index, and create its renditions."""
+    audio_file.set_audio(data)
+    audio_file.section_index = section_index
+    create_renditions(audio_file, data)
+
+
+def select_rendition(audio_file: AudioFile, name: str = None, save_data: bool = False) -> AudioRendition | None:
+    """
+    The rendition to serve: the one named, else the data-saving one when the client asks to save
+    data, else None for the original audio.
+    """
+    if not name and save_data:
+        name = Config.SAVE_DATA_RENDITION
+    if not name:
+        return None
+    return next((rendition for rendition in audio_file.renditions if rendition.name == name), None)
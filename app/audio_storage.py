@@ -0,0 +1,113 @@
+from abc import ABC, abstractmethod
+import hashlib
+import os
+import uuid
+
+from config import Config
+
+
+class AudioStorage(ABC):
+    """
+    Storage of encoded audio, addressed by key.
+
+    The interface mirrors an object store (put/get/open/delete by key) so that an S3-style
+    backend can replace the filesystem one. Keys are the sha256 digest of the content, so
+    identical audio is stored once.
+    """
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Store the data and return its key."""
+
+    def get(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    @abstractmethod
+    def open(self, key: str):
+        """A readable binary file object for the stored data."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether data is stored under the key."""
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        """Size of the stored data in bytes."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove the stored data."""
+
+    @abstractmethod
+    def keys(self):
+        """Iterate over the keys of all stored objects."""
+
+    def local_path(self, key: str) -> str | None:
+        """Path of the stored data on the local filesystem, if the backend has one."""
+        return None
+
+
+class FilesystemAudioStorage(AudioStorage):
+    """Content-addressed storage under a local directory, sharded by the first digest bytes."""
+
+    def __init__(self, root: str = None):
+        self.root = root or Config.AUDIO_STORAGE_DIR
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], f"{key}.mp3")
+
+    def put(self, data: bytes) -> str:
+        key = self.digest(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return key
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".mp3"):
+                    yield filename[:-len(".mp3")]
+
+    def local_path(self, key: str) -> str:
+        return self._path(key)
+
+
+_BACKENDS = {
+    'filesystem': FilesystemAudioStorage,
+}
+_storage = None
+
+
+def get_audio_storage() -> AudioStorage:
+    """The storage backend selected by `Config.AUDIO_STORAGE_BACKEND`."""
+    global _storage
+    if _storage is None:
+        _storage = _BACKENDS[Config.AUDIO_STORAGE_BACKEND]()
+    return _storage
@@ -0,0 +1,267 @@
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+
+from app import mp3_frames
+from config import Config
+
+
+def stream_path(kind: str, object_id: int) -> str:
+    """Path of the progressive MP3 of a summary or email being synthesized."""
+    return os.path.join(Config.AUDIO_STREAM_DIR, f"{kind}_{object_id}.mp3")
+
+
+def _done_path(path: str) -> str:
+    return f"{path}.done"
+
+
+def _is_stale(path: str) -> bool:
+    """
+    Whether an unfinished stream has not grown for longer than a worker's lease, i.e. its writer
+    is gone, e.g. because the worker crashed.
+    """
+    try:
+        return os.path.getmtime(path) < time.time() - Config.ASYNC_LEASE_SECONDS
+    except FileNotFoundError:
+        return True
+
+
+def is_streaming(kind: str, object_id: int) -> bool:
+    """Whether audio is being, or was recently, written for progressive playback."""
+    path = stream_path(kind, object_id)
+    if os.path.exists(_done_path(path)):
+        return os.path.exists(path)
+    return not _is_stale(path)
+
+
+def is_done(kind: str, object_id: int) -> bool:
+    return os.path.exists(_done_path(stream_path(kind, object_id)))
+
+
+def remove_stream(kind: str, object_id: int):
+    """Remove the stream of a summary or email, e.g. when its synthesis was taken back from a worker."""
+    path = stream_path(kind, object_id)
+    for path in (path, _done_path(path)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ProgressiveAudioWriter:
+    """
+    Appends synthesized segments to a growing MP3 file that can be played while it is written.
+
+    Frames are appended as raw MPEG audio without a Xing header, since the final frame count is
+    not known yet; pauses are written as silent frames. `finish()` drops a marker next to the file
+    so that readers know no more bytes will come.
+
+    The writer stops writing once its file is removed or replaced, which happens when the request
+    is taken back from its worker and run again, so a worker that lost its lease does not write
+    into the stream of the next attempt.
+    """
+
+    def __init__(self, kind: str, object_id: int, pause_ms: int = 1000):
+        self.path = stream_path(kind, object_id)
+        self.pause_ms = pause_ms
+        self._header = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        _sweep()
+        for path in (self.path, _done_path(self.path)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._file = open(self.path, "wb")
+
+    def _owns_stream(self) -> bool:
+        """Whether the file at `path` is still the one this writer created."""
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except (FileNotFoundError, ValueError):
+            # ValueError: the file was already closed
+            return False
+
+    def _close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def append(self, segment: bytes, pause_before: bool = False):
+        self.append_frames(list(mp3_frames.iter_frames(segment)), pause_before)
+
+    def append_frames(self, frames: list[tuple], pause_before: bool = False):
+        """Append `(header, frame)` pairs, e.g. the frames of a segment received so far."""
+        if not frames or self._file.closed:
+            return
+        if not self._owns_stream():
+            logging.warning(f"Audio stream {self.path} was removed or replaced, no longer writing to it")
+            self._close()
+            return
+        if self._header is None:
+            self._header = frames[0][0]
+        elif frames[0][0].format() != self._header.format():
+            raise mp3_frames.Mp3FormatError("Segment does not match the format of the stream")
+
+        if pause_before and self.pause_ms:
+            count = round(self.pause_ms * self._header.sample_rate / self._header.samples / 1000)
+            self._file.write(mp3_frames.silent_frame(self._header) * count)
+        for _, frame in frames:
+            self._file.write(frame)
+        self._file.flush()
+
+    def finish(self):
+        if self._owns_stream():
+            open(_done_path(self.path), "wb").close()
+        self._close()
+
+    def abort(self):
+        """Remove the stream of a synthesis that failed; readers stop when the file is gone."""
+        if self._owns_stream():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        self._close()
+
+
+class OrderedSegmentRelay:
+    """
+    Appends segments synthesized concurrently to a ProgressiveAudioWriter in order.
+
+    The bytes of the earliest unfinished segment are written as they arrive from the provider,
+    those of later segments are held until every segment before them is finished. Safe to call
+    from several threads.
+    """
+
+    def __init__(self, writer: ProgressiveAudioWriter, pause_before: set[int]):
+        """
+        Args:
+            writer: Stream to append to
+            pause_before: Indexes of the segments preceded by a pause, filled in before each
+                segment is submitted
+        """
+        self.writer = writer
+        self.pause_before = pause_before
+        self._lock = threading.Lock()
+        self._next = 0  # Index of the segment being written
+        self._readers = {}
+        self._held = {}
+        self._finished = set()
+        self._written = set()
+
+    def feed(self, index: int, data: bytes):
+        """Bytes of segment `index`, as they arrive."""
+        with self._lock:
+            reader = self._readers.setdefault(index, mp3_frames.FrameReader())
+            self._hold_or_write(index, reader.feed(data))
+
+    def finish(self, index: int, segment: bytes):
+        """The whole audio of segment `index`, once it is synthesized or read from a cache."""
+        with self._lock:
+            if index not in self._readers:
+                # Not streamed, e.g. a cached segment
+                self._hold_or_write(index, list(mp3_frames.iter_frames(segment)))
+            self._finished.add(index)
+            while self._next in self._finished:
+                self._next += 1
+                self._write(self._next, self._held.pop(self._next, []))
+
+    def _hold_or_write(self, index: int, frames: list):
+        if index == self._next:
+            self._write(index, frames)
+        else:
+            self._held.setdefault(index, []).extend(frames)
+
+    def _write(self, index: int, frames: list):
+        if not self.writer or not frames:
+            return
+        try:
+            self.writer.append_frames(frames, pause_before=index in self.pause_before and index not in self._written)
+        except mp3_frames.Mp3FormatError as e:
+            logging.warning(f"Progressive playback stopped: {e}")
+            self.writer.abort()
+            self.writer = None
+            return
+        self._written.add(index)
+
+
+@contextmanager
+def progressive_audio(kind: str, object_id: int, enabled: bool = True):
+    """
+    A ProgressiveAudioWriter for the block, or None when not `enabled`.
+
+    The stream is finished when the block completes and removed when it raises.
+    """
+    if not enabled:
+        yield None
+        return
+    writer = ProgressiveAudioWriter(kind, object_id)
+    try:
+        yield writer
+    except Exception:
+        writer.abort()
+        raise
+    writer.finish()
+
+
+def _sweep():
+    """
+    Remove streams that finished longer than `Config.AUDIO_STREAM_RETENTION` seconds ago, and
+    unfinished streams whose writer is gone.
+    """
+    cutoff = time.time() - Config.AUDIO_STREAM_RETENTION
+    for entry in os.scandir(Config.AUDIO_STREAM_DIR):
+        if entry.name.endswith(".mp3.done") and entry.stat().st_mtime < cutoff:
+            for path in (entry.path, entry.path[:-len(".done")]):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            logging.info(f"Removed finished audio stream {entry.name[:-len('.done')]}")
+        elif (entry.name.endswith(".mp3") and not os.path.exists(_done_path(entry.path))
+              and _is_stale(entry.path)):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            logging.info(f"Removed abandoned audio stream {entry.name}")
+
+
+def follow(kind: str, object_id: int, chunk_size: int = 64 * 1024, poll_interval: float = 0.5):
+    """
+    Yield the bytes of a progressive MP3 as they are written, until it is finished.
+
+    Yields nothing if there is no stream. Each listener holds a worker, so the stream is closed
+    if it does not grow for `Config.AUDIO_STREAM_IDLE_TIMEOUT` seconds, and after
+    `Config.AUDIO_STREAM_MAX_DURATION` seconds in any case.
+    """
+    path = stream_path(kind, object_id)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+
+    with f:
+        idle_since = time.time()
+        deadline = idle_since + Config.AUDIO_STREAM_MAX_DURATION
+        while True:
+            data = f.read(chunk_size)
+            if data:
+                idle_since = time.time()
+                yield data
+                continue
+            # Check for completion only once everything written so far was read
+            if os.path.exists(_done_path(path)):
+                data = f.read()
+                if data:
+                    yield data
+                return
+            if not os.path.exists(path):
+                return
+            if time.time() - idle_since > Config.AUDIO_STREAM_IDLE_TIMEOUT:
+                logging.warning(f"Audio stream {path} stopped growing, closing it")
+                return
+            if time.time() > deadline:
+                logging.warning(f"Audio stream {path} still growing after {Config.AUDIO_STREAM_MAX_DURATION}s, closing it")
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,92 @@
+import logging
+
+import openai
+
+from config import Config
+
+# Errors worth retrying, possibly on another model; anything else (bad request, auth, ...) would fail again
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class ModelRoute:
+    """The model, fallback model and timeout a call site runs with."""
+
+    def __init__(self, call_site: str, tier: str, model: str, fallback: str = None, timeout: float = None):
+        self.call_site = call_site
+        self.tier = tier
+        self.model = model
+        self.fallback = fallback
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f"ModelRoute({self.call_site} -> {self.tier}: {self.model}, fallback={self.fallback}, timeout={self.timeout})"
+
+
+class ModelRouter:
+    """
+    Routes each LLM call site to a model tier.
+
+    `Config.MODEL_ROUTES` maps call sites to tiers and `Config.MODEL_TIERS` maps tiers to a
+    primary model, a fallback model and a request timeout in seconds. Call sites that are not
+    in the routing table use `Config.DEFAULT_MODEL_TIER`.
+    """
+
+    def __init__(self, client: openai.OpenAI, routes: dict = None, tiers: dict = None):
+        self.client = client
+        self.routes = routes or Config.MODEL_ROUTES
+        self.tiers = tiers or Config.MODEL_TIERS
+
+    def route(self, call_site: str) -> ModelRoute:
+        tier = self.routes.get(call_site, Config.DEFAULT_MODEL_TIER)
+        settings = self.tiers[tier]
+        return ModelRoute(
+            call_site,
+            tier,
+            settings['model'],
+            fallback=settings.get('fallback'),
+            timeout=settings.get('timeout'),
+        )
+
+    def model(self, call_site: str) -> str:
+        """The primary model of the call site."""
+        return self.route(call_site).model
+
+    def parse(self, call_site: str, **kwargs):
+        """`beta.chat.completions.parse` on the model of the call site."""
+        return self._call(call_site, lambda client: client.beta.chat.completions.parse, **kwargs)
+
+    def create(self, call_site: str, **kwargs):
+        """`chat.completions.create` on the model of the call site."""
+        return self._call(call_site, lambda client: client.chat.completions.create, **kwargs)
+
+    def stream(self, call_site: str, **kwargs):
+        """
+        `beta.chat.completions.stream` on the primary model of the call site.
+
+        Streams do not fall back: by the time an error surfaces, part of the output may
+        already have been consumed.
+        """
+        route = self.route(call_site)
+        return self.client.beta.chat.completions.stream(model=route.model, timeout=route.timeout, **kwargs)
+
+    def _call(self, call_site, method, **kwargs):
+        """
+        Call `method(client)` on the primary model of the call site, then on its fallback after a
+        transient error.
+
+        With a fallback, the primary is called without the SDK's own retries, so the fallback
+        starts as soon as the tier's timeout expires rather than after several timeouts.
+        """
+        route = self.route(call_site)
+        if not route.fallback or route.fallback == route.model:
+            return method(self.client)(model=route.model, timeout=route.timeout, **kwargs)
+        try:
+            return method(self.client.with_options(max_retries=0))(model=route.model, timeout=route.timeout, **kwargs)
+        except TRANSIENT_ERRORS as e:
+            logging.warning(f"{call_site} failed on {route.model} ({type(e).__name__}: {e}), falling back to {route.fallback}")
+            return method(self.client)(model=route.fallback, timeout=route.timeout, **kwargs)
@@ -3,8 +3,10 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from datetime import datetime, timedelta
+import os
 import secrets
 
+from app.audio_storage import get_audio_storage
 from config import Config
 
 db = SQLAlchemy(engine_options={'pool_pre_ping': True})
@@ -102,6 +104,7 @@ class Summary(db.Model):
     
     # Add this line to existing model
     email_ids = db.Column(db.JSON)  # Store array of email IDs used in summary
+    input_fingerprint = db.Column(db.String(64), index=True)  # Hash of everything the synthesis depends on
 
     
     def to_text(self) -> str:
@@ -200,7 +203,7 @@ class Topic(db.Model):
     summary = db.Column(db.Text, nullable=False)
     email_id = db.Column(db.Integer, db.ForeignKey('email.id', ondelete='CASCADE'), nullable=False)
 
-    news = db.relationship('News', backref='topic', lazy=True)
+    news = db.relationship('News', backref='topic', lazy=True, order_by='News.id')
     #email = db.relationship('Email', backref='topics', lazy=True)
 
 class Source(db.Model):
@@ -223,14 +226,14 @@ class Email(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     
     # Relationships
-    topics = db.relationship('Topic', backref='email', lazy=True)
+    topics = db.relationship('Topic', backref='email', lazy=True, order_by='Topic.id')
     sources = db.relationship('Source', backref='email', lazy=True)
     user = db.relationship('User', backref=db.backref('emails', lazy=True))
 
     has_audio = db.Column(db.Boolean, default=False)
     audio_text = db.Column(db.Text, nullable=True)  # New field for storing audio-friendly text
 
-    #audio_creation_state = db.Column(db.String(20), default='none')  # Possible values: 'none', 'started', 'completed'
+    audio_creation_state = db.Column(db.String(20), default='none')  # Possible values: 'none', 'started', 'completed', 'skipped' (left for on demand)
 
     def to_newsletter(self):
         """Convert the email record to a Newsletter object format"""
@@ -337,9 +340,17 @@ class TaskExecution(db.Model):
 class AudioFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
-    data = db.Column(db.LargeBinary, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=True)  # Legacy inline audio, moved out by migrate_audio_storage
     created_at = db.Column(db.DateTime, default=datetime.now)
     
+    # Audio held by the audio storage backend
+    storage_key = db.Column(db.String(100), nullable=True, index=True)
+    size = db.Column(db.Integer, nullable=True)
+    digest = db.Column(db.String(64), nullable=True)  # sha256 of the audio
+    updated_at = db.Column(db.DateTime, nullable=True)  # When the audio last changed, for Last-Modified
+    # Start and end of each section, in seconds and bytes: [{'title', 'start', 'end', 'start_byte', 'end_byte'}]
+    section_index = db.Column(db.JSON, nullable=True)
+    
     # Foreign keys for different types of content
     summary_id = db.Column(db.Integer, db.ForeignKey('summary.id', ondelete='CASCADE'), nullable=True)
     email_id = db.Column(db.Integer, db.ForeignKey('email.id', ondelete='CASCADE'), nullable=True)
@@ -348,6 +359,51 @@ class AudioFile(db.Model):
     summary = db.relationship('Summary', backref=db.backref('audio_file', uselist=False))
     email = db.relationship('Email', backref=db.backref('audio_file', uselist=False))
 
+    def set_audio(self, data: bytes):
+        """Store the audio with the storage backend and reference it from this row."""
+        storage = get_audio_storage()
+        digest = storage.digest(data)
+        if digest != self.digest:
+            # Renditions of the previous audio are stale
+            self.renditions = []
+            self.updated_at = datetime.now()
+        self.storage_key = storage.put(data)
+        self.digest = digest
+        self.size = len(data)
+        self.data = None
+
+    def read_audio(self) -> bytes:
+        """The audio bytes, from the storage backend or from the legacy inline column."""
+        if self.storage_key:
+            return get_audio_storage().get(self.storage_key)
+        return self.data
+
+class AudioRendition(db.Model):
+    """An alternative encoding of an AudioFile, e.g. a low-bitrate variant for slow connections."""
+    id = db.Column(db.Integer, primary_key=True)
+    audio_file_id = db.Column(db.Integer, db.ForeignKey('audio_file.id', ondelete='CASCADE'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    mimetype = db.Column(db.String(50), nullable=False)
+    storage_key = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    digest = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    audio_file = db.relationship('AudioFile', backref=db.backref('renditions', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.UniqueConstraint('audio_file_id', 'name', name='unique_audio_rendition'),
+    )
+
+    @property
+    def filename(self) -> str:
+        base, _ = os.path.splitext(self.audio_file.filename)
+        extension = Config.AUDIO_RENDITIONS.get(self.name, {}).get('format', 'mp3')
+        return f"{base}_{self.name}.{extension}"
+
+    def read_audio(self) -> bytes:
+        return get_audio_storage().get(self.storage_key)
+
 class Invitation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -368,7 +424,7 @@ class ReadStatus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     item_id = db.Column(db.Integer, nullable=False)
-    item_type = db.Column(db.String(20), nullable=False)  # 'summary', 'email', or 'newsletter'
+    item_type = db.Column(db.String(20), nullable=False)  # 'summary', 'email', 'newsletter', or 'email_audio' once its audio is played
     read_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', backref=db.backref('read_statuses', lazy=True))
@@ -378,9 +434,24 @@ class ReadStatus(db.Model):
 
 class AsyncProcessingRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    email_id = db.Column(db.Integer, db.ForeignKey('email.id', ondelete='CASCADE'), nullable=False)
+    # 'audio' requests target an email, 'summary' requests fill in a pending summary
+    email_id = db.Column(db.Integer, db.ForeignKey('email.id', ondelete='CASCADE'), nullable=True)
+    summary_id = db.Column(db.Integer, db.ForeignKey('summary.id', ondelete='CASCADE'), nullable=True)
     type = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(50), default='pending')
+    status = db.Column(db.String(50), default='pending')  # 'pending', 'started', 'completed', 'failed'
+    error_message = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
-
-    email = db.relationship('Email', backref=db.backref('async_requests', lazy=True))
\ No newline at end of file
+    # Set when a worker claims the request, and when it finishes it
+    worker = db.Column(db.String(100), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # A started request belongs to its worker until the lease expires; the worker renews it while running
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Lane of the request, see app.request_queue: 10 when a user is waiting on it, 0 for batch work
+    priority = db.Column(db.Integer, default=10, nullable=False)
+    # [event, data] pairs reported by the handler while it runs, relayed by /generate-summary/stream
+    progress = db.Column(db.JSON, nullable=True)
+
+    email = db.relationship('Email', backref=db.backref('async_requests', lazy=True))
+    summary = db.relationship('Summary', backref=db.backref('async_requests', lazy=True))
\ No newline at end of file
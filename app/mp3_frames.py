@@ -0,0 +1,266 @@
+"""
+Frame-level MPEG audio Layer III concatenation.
+
+Joins MP3 buffers by copying their audio frames, without decoding to PCM or re-encoding.
+Pauses are made of silent frames built from the header of the first frame, and the output
+starts with a Xing/Info frame carrying the frame and byte counts so players can seek and
+report the duration.
+"""
+import struct
+
+# Bitrates in kbps by [MPEG-1][bitrate index] for Layer III
+_BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates in Hz by version bits and sample rate index
+_SAMPLE_RATES = {
+    0b11: [44100, 48000, 32000],  # MPEG-1
+    0b10: [22050, 24000, 16000],  # MPEG-2
+    0b00: [11025, 12000, 8000],  # MPEG-2.5
+}
+_LAYER_III = 0b01
+_MONO = 0b11
+
+
+class Mp3FormatError(ValueError):
+    """The buffers are not MP3 audio, or cannot be joined without re-encoding."""
+
+
+class FrameHeader:
+    """The 4-byte header of an MPEG audio Layer III frame."""
+
+    def __init__(self, raw: bytes):
+        if len(raw) < 4 or raw[0] != 0xFF or raw[1] & 0xE0 != 0xE0:
+            raise Mp3FormatError("No frame sync")
+        self.raw = bytes(raw[:4])
+        self.version = (raw[1] >> 3) & 0b11
+        layer = (raw[1] >> 1) & 0b11
+        self.protected = not raw[1] & 0b1
+        bitrate_index = raw[2] >> 4
+        sample_rate_index = (raw[2] >> 2) & 0b11
+        self.padding = (raw[2] >> 1) & 0b1
+        self.channel_mode = raw[3] >> 6
+        if self.version not in _SAMPLE_RATES or layer != _LAYER_III:
+            raise Mp3FormatError("Not an MPEG audio Layer III frame")
+        if bitrate_index in (0, 15) or sample_rate_index == 3:
+            raise Mp3FormatError("Unsupported bitrate or sample rate")
+        self.bitrate_index = bitrate_index
+        self.bitrate = _BITRATES[self.mpeg1][bitrate_index] * 1000
+        self.sample_rate = _SAMPLE_RATES[self.version][sample_rate_index]
+
+    @property
+    def mpeg1(self) -> bool:
+        return self.version == 0b11
+
+    @property
+    def samples(self) -> int:
+        """Samples per channel in the frame."""
+        return 1152 if self.mpeg1 else 576
+
+    @property
+    def length(self) -> int:
+        """Frame length in bytes, header included."""
+        return (144 if self.mpeg1 else 72) * self.bitrate // self.sample_rate + self.padding
+
+    @property
+    def side_info_length(self) -> int:
+        if self.mpeg1:
+            return 17 if self.channel_mode == _MONO else 32
+        return 9 if self.channel_mode == _MONO else 17
+
+    def format(self) -> tuple:
+        """What two frames must share to be played back from the same stream."""
+        return self.version, self.sample_rate, self.channel_mode == _MONO
+
+    def with_bitrate(self, bitrate_index: int) -> 'FrameHeader':
+        """The same header without padding or CRC, at another bitrate."""
+        raw = bytearray(self.raw)
+        raw[1] |= 0b1
+        raw[2] = (bitrate_index << 4) | (raw[2] & 0b1100)
+        return FrameHeader(raw)
+
+
+def _id3v2_length(data: bytes) -> int:
+    """Length of the ID3v2 tag at the start of `data`, 0 if there is none."""
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _strip_tags(data: bytes) -> bytes:
+    """Remove a leading ID3v2 tag and a trailing ID3v1 tag."""
+    data = data[_id3v2_length(data):]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+def _is_info_frame(header: FrameHeader, frame: bytes) -> bool:
+    """Whether the frame is a Xing/Info or VBRI header rather than audio."""
+    offset = 4 + (2 if header.protected else 0) + header.side_info_length
+    return frame[offset:offset + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+
+def _read_frames(data: bytes, first: bool) -> tuple[list[tuple[FrameHeader, bytes]], int, bool]:
+    """
+    Read the complete audio frames at the start of `data`.
+
+    Bytes that do not start a valid frame are stepped over; when `first`, the first frame is
+    skipped if it is a Xing/Info/VBRI header.
+
+    Returns:
+        list[tuple[FrameHeader, bytes]]: the audio frames
+        int: the number of bytes read
+        bool: whether the next frame is still the first one
+    """
+    frames = []
+    offset = 0
+    while offset + 4 <= len(data):
+        try:
+            header = FrameHeader(data[offset:offset + 4])
+        except Mp3FormatError:
+            offset += 1
+            continue
+        frame = data[offset:offset + header.length]
+        if len(frame) < header.length:
+            break
+        offset += header.length
+        if first:
+            first = False
+            if _is_info_frame(header, frame):
+                continue
+        frames.append((header, frame))
+    return frames, offset, first
+
+
+def iter_frames(data: bytes):
+    """
+    Yield `(header, frame)` for each audio frame of an MP3 buffer.
+
+    ID3 tags and Xing/Info/VBRI header frames are skipped, and bytes between frames that do
+    not start a valid frame are stepped over.
+    """
+    frames, _, _ = _read_frames(_strip_tags(data), first=True)
+    yield from frames
+
+
+class FrameReader:
+    """
+    Incremental `iter_frames`, for MP3 bytes that arrive in pieces, e.g. from a streaming
+    text-to-speech response: `feed()` returns the frames completed by each piece.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._tag_skipped = False
+        self._first = True
+
+    def feed(self, data: bytes) -> list[tuple[FrameHeader, bytes]]:
+        self._buffer += data
+        if not self._tag_skipped:
+            # Wait for the whole leading ID3v2 tag, if there is one, to skip it
+            tag_length = _id3v2_length(self._buffer)
+            if len(self._buffer) < max(10, tag_length):
+                return []
+            self._buffer = self._buffer[tag_length:]
+            self._tag_skipped = True
+        frames, read, self._first = _read_frames(self._buffer, self._first)
+        self._buffer = self._buffer[read:]
+        return frames
+
+
+def silent_frame(header: FrameHeader) -> bytes:
+    """
+    An audio frame that decodes to silence, in the format of `header`.
+
+    The side information is all zeros (no main data, no bit reservoir), so every granule
+    decodes to zero samples.
+    """
+    header = header.with_bitrate(header.bitrate_index)
+    return header.raw + bytes(header.length - 4)
+
+
+def info_frame(header: FrameHeader, frames: int, size: int, vbr: bool) -> bytes:
+    """
+    A Xing (VBR) or Info (CBR) frame describing a stream of `frames` audio frames of `size` bytes.
+
+    The byte count includes the info frame itself. The lowest bitrate at or above the one of
+    `header` whose frame is large enough for the tag is used.
+    """
+    offset = 4 + header.side_info_length
+    for bitrate_index in range(header.bitrate_index, 15):
+        candidate = header.with_bitrate(bitrate_index)
+        if candidate.length >= offset + 16:
+            break
+    else:
+        raise Mp3FormatError("No frame large enough for a Xing header")
+
+    frame = bytearray(candidate.length)
+    frame[:4] = candidate.raw
+    # Flags: frame count and byte count present
+    tag = (b"Xing" if vbr else b"Info") + struct.pack(">III", 0b11, frames, size + candidate.length)
+    frame[offset:offset + len(tag)] = tag
+    return bytes(frame)
+
+
+def concatenate(buffers: list[bytes], pause_ms: int = 0, pause_before: set[int] = None) -> bytes:
+    """
+    Join MP3 buffers frame by frame, with `pause_ms` of silence between consecutive buffers.
+
+    `pause_before` restricts the pauses to the indexes of the buffers they precede; by default
+    every buffer but the first is preceded by one.
+
+    Raises:
+        Mp3FormatError: if a buffer holds no MP3 frames, or the buffers differ in MPEG version,
+            sample rate or channel count.
+    """
+    return concatenate_indexed(buffers, pause_ms, pause_before)[0]
+
+
+def concatenate_indexed(buffers: list[bytes], pause_ms: int = 0, pause_before: set[int] = None) -> tuple[bytes, list[tuple[int, float]]]:
+    """
+    Like `concatenate`, also returning where each buffer starts in the output.
+
+    Returns:
+        bytes: the joined MP3.
+        list[tuple[int, float]]: the byte offset and time in seconds of the first frame of each
+            buffer, after the pause preceding it. The last entry is the end of the output.
+    """
+    frames = []
+    starts = []
+    first_header = None
+    for index, buffer in enumerate(buffers):
+        buffer_frames = list(iter_frames(buffer))
+        if not buffer_frames:
+            raise Mp3FormatError(f"Buffer {index} holds no MP3 frames")
+        if first_header is None:
+            first_header = buffer_frames[0][0]
+        elif any(header.format() != first_header.format() for header, _ in buffer_frames):
+            raise Mp3FormatError(f"Buffer {index} does not match the format of the first buffer")
+
+        if frames and pause_ms and (pause_before is None or index in pause_before):
+            silence = silent_frame(first_header)
+            count = round(pause_ms * first_header.sample_rate / first_header.samples / 1000)
+            frames.extend([(first_header, silence)] * count)
+        starts.append(len(frames))
+        frames.extend(buffer_frames)
+
+    if first_header is None:
+        return b"", []
+
+    size = sum(len(frame) for _, frame in frames)
+    vbr = len({header.bitrate for header, _ in frames}) > 1
+    output = bytearray(info_frame(first_header, len(frames), size, vbr))
+    frame_offsets = []
+    for _, frame in frames:
+        frame_offsets.append(len(output))
+        output += frame
+    frame_offsets.append(len(output))
+
+    seconds_per_frame = first_header.samples / first_header.sample_rate
+    starts.append(len(frames))
+    index = [(frame_offsets[start], round(start * seconds_per_frame, 3)) for start in starts]
+    return bytes(output), index
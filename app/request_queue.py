@@ -0,0 +1,129 @@
+"""
+Enqueuing async requests and waking the workers that process them.
+
+Enqueuers send a Postgres NOTIFY in the enqueuing transaction, so it is delivered when the
+request is committed. Each process runs one RequestListener that LISTENs on the channel and
+wakes its idle workers; workers still check the queue every Config.ASYNC_SAFETY_POLL_INTERVAL
+seconds in case a notification is lost. On other databases, workers are only woken by
+requests enqueued in their own process, and otherwise poll every Config.ASYNC_POLL_INTERVAL
+seconds.
+
+Requests are queued in two lanes: HIGH_PRIORITY for requests a user is waiting on, and
+LOW_PRIORITY for scheduled batch work. Workers take high-priority requests first, but every
+Config.ASYNC_LOW_PRIORITY_EVERY-th claim of a worker takes the oldest low-priority request, so
+a steady stream of interactive requests cannot starve batch work.
+"""
+import logging
+import select
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.models import AsyncProcessingRequest, db
+from config import Config
+
+# Set when requests may be waiting; idle workers of this process wait on it
+wakeup = threading.Event()
+
+# AsyncProcessingRequest.priority of each lane; higher is claimed first
+HIGH_PRIORITY = 10
+LOW_PRIORITY = 0
+
+
+def is_postgres() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    """Wake the idle workers of this process once requests enqueued in the session are committed."""
+    if session.info.pop('enqueued_requests', False):
+        wakeup.set()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_enqueued(session, previous_transaction):
+    session.info.pop('enqueued_requests', None)
+
+
+def enqueue_request(priority: int = HIGH_PRIORITY, **fields) -> AsyncProcessingRequest:
+    """
+    Add a pending async request to the session and notify the workers when it is committed.
+
+    Args:
+        priority: HIGH_PRIORITY for requests a user is waiting on, LOW_PRIORITY for batch work
+        **fields: type and target of the request
+
+    The caller commits the session.
+    """
+    request = AsyncProcessingRequest(status='pending', priority=priority, **fields)
+    db.session.add(request)
+    if is_postgres():
+        # Delivered to listeners when the transaction commits, and dropped if it rolls back
+        db.session.execute(text("SELECT pg_notify(:channel, '')"), {'channel': Config.ASYNC_NOTIFY_CHANNEL})
+    db.session.info['enqueued_requests'] = True
+    return request
+
+
+def unfinished_request(type: str, **target) -> AsyncProcessingRequest | None:
+    """A queued or running request of the type for the target, e.g. `email_id=...`, if there is one."""
+    return AsyncProcessingRequest.query.filter_by(type=type, **target).filter(
+        AsyncProcessingRequest.status.in_(['pending', 'started'])
+    ).first()
+
+
+def wait_for_requests(listening: bool):
+    """Block until a request may be waiting, or until the next poll of the queue is due."""
+    wakeup.wait(Config.ASYNC_SAFETY_POLL_INTERVAL if listening else Config.ASYNC_POLL_INTERVAL)
+    wakeup.clear()
+
+
+class RequestListener:
+    """Thread that LISTENs for enqueued requests on Postgres and wakes the workers."""
+
+    def __init__(self, app):
+        self.app = app
+        self.listening = False
+        self.thread = threading.Thread(target=self.run, name="async-request-listener", daemon=True)
+
+    def start(self):
+        with self.app.app_context():
+            if not is_postgres():
+                logging.info(f"Not listening for async requests on {db.engine.dialect.name}, workers will poll")
+                return
+        self.listening = True
+        self.thread.start()
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self._listen()
+                except Exception as e:
+                    logging.error(f"Async request listener failed, reconnecting: {str(e)}")
+                # Requests may have been enqueued while not listening
+                wakeup.set()
+                time.sleep(Config.ASYNC_LISTEN_RETRY_DELAY)
+
+    def _listen(self):
+        connection = db.engine.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{Config.ASYNC_NOTIFY_CHANNEL}"')
+            logging.info(f"Listening for async requests on channel {Config.ASYNC_NOTIFY_CHANNEL}")
+            while True:
+                # Wake up now and then to notice a dropped connection
+                if select.select([dbapi_connection], [], [], Config.ASYNC_SAFETY_POLL_INTERVAL) == ([], [], []):
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    continue
+                dbapi_connection.poll()
+                if dbapi_connection.notifies:
+                    dbapi_connection.notifies.clear()
+                    wakeup.set()
+        finally:
+            connection.invalidate()
@@ -1,21 +1,29 @@
 # app/routes.py
-from flask import Blueprint, render_template, redirect, url_for, request, flash, session, current_app, jsonify, send_file
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, current_app, jsonify, send_file, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from openai import OpenAI
+from app import audio_stream
+from app.audio_renditions import select_rendition
+from app.audio_storage import AudioStorage, get_audio_storage
 from app.mailbox_accessor import MailboxAccessor
+from app.model_router import ModelRouter
 from app.models import Newsletter, db, User, Summary, Email, AudioFile, Invitation, ReadStatus, AsyncProcessingRequest
 from app.oauth import create_google_oauth_flow
-from datetime import datetime, timedelta
+from app.request_queue import HIGH_PRIORITY, enqueue_request, unfinished_request
+from datetime import datetime
 import re
+import json
 
 import logging
 import os
+import time
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
 import io
 
-from app.summary_generator import SummaryGenerator
 from app.voice_generator import VoiceClipGenerator
 from app.email_sender import EmailSender
+from config import Config
 logging.basicConfig(level=logging.DEBUG)
 
 
@@ -214,70 +222,160 @@ def authorize_gmail():
 
 
 
+def _has_summary_in_progress(user_id):
+    """Whether a summary of this user is being generated: queued or running as a 'summary' request"""
+    for summary in Summary.query.filter_by(user_id=user_id, status='pending'):
+        if unfinished_request('summary', summary_id=summary.id):
+            return True
+    return False
+
+def _create_pending_summary(user_id):
+    """Create and commit an empty summary record with status 'pending'"""
+    new_summary = Summary(
+        user_id=user_id,
+        title="",
+        content="",
+        from_date=datetime.now(),
+        to_date=datetime.now(),
+        status='pending',
+        has_audio=False
+    )
+    db.session.add(new_summary)
+    db.session.commit()
+    db.session.refresh(new_summary)
+    return new_summary
+
+def _enqueue_summary(user_id):
+    """Create a pending summary and the 'summary' request that fills it in, and commit them"""
+    new_summary = _create_pending_summary(user_id)
+    job = enqueue_request(summary_id=new_summary.id, type='summary')
+    db.session.commit()
+    return job
+
+def _summary_failure_message(job):
+    return f'Failed to generate summary. Please try again. {job.error_message or ""}'.strip()
+
+def _sse(event, data):
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 @main.route('/generate-summary', methods=['POST'])
 @login_required
 def generate_summary():
+    """
+    Queue a summary generation job for the background processor.
+
+    Responds 202 with the job id and a URL to poll for its status.
+    """
     try:
         # Clear any existing flash messages
         session.pop('_flashes', None)
         
         # ensure not previous summary is being generated
-        five_minutes_ago = datetime.now() - timedelta(minutes=5)
-        recent_pending_summaries = Summary.query.filter(
-            Summary.user_id == current_user.id,
-            Summary.status == 'pending',
-            Summary.created_at >= five_minutes_ago
-        ).all()
-        
-        if recent_pending_summaries:
+        if _has_summary_in_progress(current_user.id):
             return jsonify({
                 'status': 'error',
                 'message': 'A summary is already being generated. Please wait a few minutes and try again.'
             }), 400
         
-        # Create a new summary record with status 'pending'
-        new_summary = Summary(
-            user_id=current_user.id,
-            title="",
-            content="",
-            from_date=datetime.now(),
-            to_date=datetime.now(),
-            status='pending',
-            has_audio=False
-        )
-        db.session.add(new_summary)
-        db.session.commit()
-        db.session.refresh(new_summary)
+        # Create a new summary record with status 'pending' and a job to fill it in
+        job = _enqueue_summary(current_user.id)
 
-        try:
-            summary_generator = SummaryGenerator()
-            new_summary = summary_generator.generate_summary(current_user.id, new_summary)
-        except Exception as e:
-            current_app.logger.error(f"Summary generation failed: {str(e)}")
-            Summary.query.filter_by(id=new_summary.id).delete()
-            db.session.commit()
-            return jsonify({
-                'status': 'error',
-                'message': f'Failed to generate summary. Please try again. {e}'
-            }), 400
+        return jsonify({
+            'status': 'success',
+            'message': 'Summary generation started',
+            'job_id': job.id,
+            'status_url': url_for('main.generate_summary_status', job_id=job.id)
+        }), 202
+    except Exception as e:
+        current_app.logger.error(f"Summary generation failed: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to generate summary. Please try again. {e}'
+        }), 400
 
-        db.session.add(new_summary)
-        db.session.commit()
-        
+@main.route('/generate-summary/status/<int:job_id>', methods=['GET'])
+@login_required
+def generate_summary_status(job_id):
+    job = AsyncProcessingRequest.query.get_or_404(job_id)
 
-        
-        # If successful
+    # Verify the job belongs to the current user
+    if job.type != 'summary' or not job.summary or job.summary.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    response = {'job_id': job.id, 'status': job.status}
+    if job.status == 'completed':
+        response['summary_url'] = url_for('main.read_summary', summary_id=job.summary_id)
+    elif job.status == 'failed':
+        response['message'] = _summary_failure_message(job)
+    return jsonify(response), 200
+
+@main.route('/generate-summary/stream', methods=['POST'])
+@login_required
+def generate_summary_stream():
+    """
+    Streaming variant of /generate-summary.
+
+    Queues the summary like /generate-summary, then relays the progress the background processor
+    records on the request as Server-Sent Events: 'fetched', 'extracted' and 'section' events
+    while the summary is generated, then either 'done' with the summary URL or 'error'.
+    'restarted' means the request was taken back from its worker and runs again from the start.
+    Disconnecting does not cancel the summary.
+    """
+    if _has_summary_in_progress(current_user.id):
         return jsonify({
-            'status': 'success',
-            'message': 'New summary generated successfully!'
-        }), 200
+            'status': 'error',
+            'message': 'A summary is already being generated. Please wait a few minutes and try again.'
+        }), 400
+
+    try:
+        job_id = _enqueue_summary(current_user.id).id
     except Exception as e:
         current_app.logger.error(f"Summary generation failed: {str(e)}")
+        db.session.rollback()
         return jsonify({
             'status': 'error',
             'message': f'Failed to generate summary. Please try again. {e}'
         }), 400
 
+    def events():
+        sent = 0
+        attempts = None
+        deadline = time.time() + Config.SUMMARY_STREAM_MAX_DURATION
+        while True:
+            job = db.session.get(AsyncProcessingRequest, job_id)
+            progress = job.progress or []
+            if attempts is not None and job.attempts != attempts and sent:
+                sent = 0
+                yield _sse('restarted', {})
+            attempts = job.attempts
+            for event, data in progress[sent:]:
+                yield _sse(event, data)
+            sent = len(progress)
+
+            if job.status == 'completed':
+                yield _sse('done', {
+                    'summary_id': job.summary_id,
+                    'url': url_for('main.read_summary', summary_id=job.summary_id)
+                })
+                return
+            if job.status == 'failed':
+                yield _sse('error', {'message': _summary_failure_message(job)})
+                return
+            # End the transaction so that the next poll sees the worker's updates
+            db.session.rollback()
+            if time.time() > deadline:
+                yield _sse('error', {'message': 'The summary is taking longer than usual. Check back in a few minutes.'})
+                return
+            time.sleep(Config.SUMMARY_STREAM_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @main.route('/summary/<int:summary_id>')
 @login_required
 def read_summary(summary_id):
@@ -340,7 +438,8 @@ def listen_summary(summary_id):
         flash('Summary not found', 'error')
         return redirect(url_for('main.dashboard'))
 
-    if not summary_obj.has_audio:
+    streaming = _is_audio_streaming('summary', summary_obj.id)
+    if not summary_obj.has_audio and not streaming:
         flash('No audio available for this summary', 'error')
         return redirect(url_for('main.dashboard'))
     
@@ -348,7 +447,9 @@ def listen_summary(summary_id):
         'title': summary_obj.title,
         'date': summary_obj.to_date.strftime('%B %d, %Y'),
         'back_url': url_for('main.read_summary', summary_id=summary_obj.id),
-        'audio_url': url_for('main.get_audio_file', summary_id=summary_obj.id),
+        'audio_url': url_for('main.stream_audio', kind='summary', object_id=summary_obj.id) if streaming else url_for('main.get_audio_file', summary_id=summary_obj.id, v=_audio_version(summary_obj.audio_file)),
+        'streaming': streaming,
+        'audio_index': _audio_index('summary', summary_obj.id, summary_obj.audio_file) if not streaming else [],
         'sections': [
             {
                 'header': section['header'],
@@ -423,15 +524,20 @@ def generate_audio_email(email_id):
                 'message': 'Audio already exists'
             }), 200
         
-        if email.audio_creation_state == 'started':
-                return jsonify({
+        # Requests whose worker died are requeued by the reaper, or failed and released
+        job = unfinished_request('audio', email_id=email_id) if email.audio_creation_state == 'started' else None
+        if job:
+            if job.status == 'pending' and job.priority < HIGH_PRIORITY:
+                # Queued by the batch pre-rendering, and now a user is waiting on it
+                job.priority = HIGH_PRIORITY
+                db.session.commit()
+            return jsonify({
                 'status': 'success',
                 'message': 'Audio generation started'
             }), 202
 
         # Insert a new row into the AsyncProcessingRequest table
-        new_request = AsyncProcessingRequest(email_id=email_id, type='audio', status='pending')
-        db.session.add(new_request)
+        enqueue_request(email_id=email_id, type='audio')
         email.audio_creation_state = 'started'
         db.session.commit()
 
@@ -526,6 +632,93 @@ def email_forwarder():
         
     return redirect(url_for('main.dashboard'))
 
+def _audio_version(audio_file):
+    """Short content digest used to version audio URLs, so they can be cached for long."""
+    if not audio_file or not audio_file.digest:
+        return None
+    return audio_file.digest[:16]
+
+def _audio_last_modified(asset):
+    """When the audio of an AudioFile or rendition last changed; rows are reused when audio is regenerated."""
+    return getattr(asset, 'updated_at', None) or asset.created_at
+
+def _send_audio(audio_file):
+    """
+    Send an AudioFile inline with byte-range and conditional GET support.
+    
+    The strong ETag is the sha256 of the audio, so If-None-Match and If-Range work across
+    regenerations. URLs carrying the current `v` version are cached for Config.AUDIO_CACHE_MAX_AGE;
+    unversioned URLs must be revalidated, since the audio behind them can be regenerated.
+    
+    A rendition is sent instead of the original when named by the `rendition` query parameter,
+    or when the client sends `Save-Data: on`.
+    """
+    save_data = request.headers.get('Save-Data', '').lower() == 'on'
+    asset = select_rendition(audio_file, request.args.get('rendition'), save_data) or audio_file
+    mimetype = getattr(asset, 'mimetype', 'audio/mpeg')
+    
+    data = None
+    if asset.storage_key:
+        path = get_audio_storage().local_path(asset.storage_key)
+        if path is None:
+            data = asset.read_audio()
+    else:
+        data = asset.data
+    digest = asset.digest or AudioStorage.digest(data)
+    
+    versioned = request.args.get('v') is not None and request.args.get('v') == _audio_version(audio_file)
+    if data is None and Config.AUDIO_OFFLOAD:
+        response = _offload_audio(asset, mimetype, path, digest, versioned)
+    else:
+        response = send_file(
+            path if data is None else io.BytesIO(data),
+            mimetype=mimetype,
+            as_attachment=False,
+            download_name=asset.filename,
+            conditional=True,
+            etag=digest,
+            last_modified=_audio_last_modified(asset)
+        )
+        _set_audio_cache_control(response, versioned)
+    response.vary.add('Save-Data')
+    return response
+
+def _set_audio_cache_control(response, versioned):
+    # Audio is per user: keep it out of shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if versioned:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = Config.AUDIO_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+
+def _offload_audio(asset, mimetype, path, digest, versioned):
+    """
+    Hand the delivery of a stored audio file to the front web server.
+    
+    Authorization and conditional requests are still answered here; the web server then
+    sends the bytes, including byte ranges, from the internal location named by the
+    X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd) header.
+    """
+    response = Response(mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'inline', filename=asset.filename)
+    response.set_etag(digest)
+    response.last_modified = _audio_last_modified(asset)
+    _set_audio_cache_control(response, versioned)
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+    
+    if Config.AUDIO_OFFLOAD == 'x-accel-redirect':
+        relative_path = os.path.relpath(path, Config.AUDIO_STORAGE_DIR).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = Config.AUDIO_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative_path
+    else:
+        response.headers['X-Sendfile'] = path
+    return response
+
 @main.route('/audio-file/<int:summary_id>')
 @login_required
 def get_audio_file(summary_id):
@@ -539,12 +732,7 @@ def get_audio_file(summary_id):
     if not audio_file:
         return jsonify({'error': 'No audio file available'}), 404
     
-    return send_file(
-        io.BytesIO(audio_file.data),
-        mimetype='audio/mpeg',
-        as_attachment=True,
-        download_name=audio_file.filename
-    )
+    return _send_audio(audio_file)
 
 @main.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
@@ -694,9 +882,8 @@ def chat_send():
         current_app.logger.info(f"Chat messages: {messages}")
 
         messages.append({"role": "user", "content": message})   
-        openai_client = OpenAI()
-        completion = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        completion = ModelRouter(OpenAI()).create(
+            "chat",
             messages=messages,
         )
         
@@ -756,7 +943,8 @@ def listen_email(email_id):
         flash('Unauthorized access', 'error')
         return redirect(url_for('main.dashboard'))
         
-    if not email.has_audio:
+    streaming = _is_audio_streaming('email', email.id)
+    if not email.has_audio and not streaming:
         flash('No audio available for this email', 'error')
         return redirect(url_for('main.dashboard'))
 
@@ -764,7 +952,9 @@ def listen_email(email_id):
         'title': email.name,
         'date': email.email_date.strftime('%B %d, %Y'),
         'back_url': url_for('main.read_email', email_id=email.id),
-        'audio_url': url_for('main.get_audio_file_email', email_id=email.id),
+        'audio_url': url_for('main.stream_audio', kind='email', object_id=email.id) if streaming else url_for('main.get_audio_file_email', email_id=email.id, v=_audio_version(email.audio_file)),
+        'streaming': streaming,
+        'audio_index': _audio_index('email', email.id, email.audio_file) if not streaming else [],
         'email': email
     }
     
@@ -783,12 +973,144 @@ def get_audio_file_email(email_id):
     if not audio_file:
         return jsonify({'error': 'No audio file available'}), 404
     
-    return send_file(
-        io.BytesIO(audio_file.data),
+    _record_audio_play(email_id)
+    return _send_audio(audio_file)
+
+def _record_audio_play(email_id):
+    """
+    Remember that the user played the audio of the email, to predict which audio to pre-render.
+
+    Only requests starting playback are recorded: seeks are range requests further into the audio.
+    """
+    range_header = request.headers.get('Range')
+    if request.method != 'GET' or (range_header and range_header.replace(' ', '') != 'bytes=0-'):
+        return
+    if ReadStatus.query.filter_by(user_id=current_user.id, item_id=email_id, item_type='email_audio').first():
+        return
+    db.session.add(ReadStatus(user_id=current_user.id, item_id=email_id, item_type='email_audio'))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Recorded by a concurrent range request
+        db.session.rollback()
+
+def _is_audio_streaming(kind, object_id):
+    """Whether audio of the summary or email is being synthesized for progressive playback."""
+    return audio_stream.is_streaming(kind, object_id) and not audio_stream.is_done(kind, object_id)
+
+@main.route('/audio-stream/<any(summary, email):kind>/<int:object_id>')
+@login_required
+def stream_audio(kind, object_id):
+    """Audio of a summary or email that is still being synthesized, sent as it is produced."""
+    model = Summary if kind == 'summary' else Email
+    obj = model.query.get_or_404(object_id)
+    
+    # Verify the content belongs to the current user
+    if obj.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # Finished audio is served whole, so that it can be seeked
+    if obj.has_audio and not _is_audio_streaming(kind, object_id):
+        if kind == 'summary':
+            return redirect(url_for('main.get_audio_file', summary_id=object_id))
+        return redirect(url_for('main.get_audio_file_email', email_id=object_id))
+    
+    # Without a stream there is nothing to wait for: listeners must not hold a worker
+    if not audio_stream.is_streaming(kind, object_id):
+        return jsonify({'error': 'Audio is not being generated'}), 404
+    
+    if kind == 'email':
+        _record_audio_play(object_id)
+    return Response(
+        stream_with_context(audio_stream.follow(kind, object_id)),
+        mimetype='audio/mpeg',
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    )
+
+def _audio_index(kind, object_id, audio_file):
+    """
+    The sections of an audio file with where they start and end in seconds, and the URL of the
+    audio of each section alone when its byte range is known.
+    """
+    if not audio_file or not audio_file.section_index:
+        return []
+    version = _audio_version(audio_file)
+    index = []
+    for number, section in enumerate(audio_file.section_index):
+        has_bytes = section.get('start_byte') is not None and section.get('end_byte') is not None
+        index.append({
+            'title': section['title'],
+            'start': section['start'],
+            'end': section['end'],
+            'url': url_for('main.get_audio_section', kind=kind, object_id=object_id, section=number, v=version) if has_bytes else None
+        })
+    return index
+
+def _owned_audio_file(kind, object_id):
+    """The audio file of a summary or email of the current user, or an error response."""
+    model = Summary if kind == 'summary' else Email
+    obj = model.query.get_or_404(object_id)
+    
+    # Verify the content belongs to the current user
+    if obj.user_id != current_user.id:
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    
+    audio_file = obj.audio_file
+    if not audio_file:
+        return None, (jsonify({'error': 'No audio file available'}), 404)
+    return audio_file, None
+
+@main.route('/audio-index/<any(summary, email):kind>/<int:object_id>')
+@login_required
+def get_audio_index(kind, object_id):
+    """Seek index of the audio of a summary or email: the start and end of each section."""
+    audio_file, error = _owned_audio_file(kind, object_id)
+    if error:
+        return error
+    return jsonify({
+        'duration': audio_file.section_index[-1]['end'] if audio_file.section_index else None,
+        'sections': _audio_index(kind, object_id, audio_file)
+    })
+
+@main.route('/audio-section/<any(summary, email):kind>/<int:object_id>/<int:section>')
+@login_required
+def get_audio_section(kind, object_id, section):
+    """
+    The audio of one section of a summary or email, read from its byte range in the stored audio.
+    
+    The section starts on a frame boundary and is played as an MP3 stream of its own, so a
+    player can fetch it without downloading the audio before it.
+    """
+    audio_file, error = _owned_audio_file(kind, object_id)
+    if error:
+        return error
+    
+    index = audio_file.section_index or []
+    if section >= len(index) or index[section].get('start_byte') is None:
+        return jsonify({'error': 'No such audio section'}), 404
+    start, end = index[section]['start_byte'], index[section]['end_byte']
+    if kind == 'email':
+        _record_audio_play(object_id)
+    
+    if audio_file.storage_key:
+        with get_audio_storage().open(audio_file.storage_key) as f:
+            f.seek(start)
+            data = f.read(end - start)
+    else:
+        data = audio_file.data[start:end]
+    
+    versioned = request.args.get('v') is not None and request.args.get('v') == _audio_version(audio_file)
+    response = send_file(
+        io.BytesIO(data),
         mimetype='audio/mpeg',
-        as_attachment=True,
-        download_name=audio_file.filename
+        as_attachment=False,
+        download_name=f"{os.path.splitext(audio_file.filename)[0]}_{section + 1}.mp3",
+        conditional=True,
+        etag=f"{audio_file.digest or AudioStorage.digest(audio_file.read_audio())}-{section}",
+        last_modified=_audio_last_modified(audio_file)
     )
+    _set_audio_cache_control(response, versioned)
+    return response
 
 @main.route('/api/newsletter/<int:newsletter_id>/toggle', methods=['POST'])
 @login_required
@@ -998,8 +1320,13 @@ def audio_status_email(email_id):
             return jsonify({'error': 'Unauthorized'}), 403
 
         # Check the audio creation state and has_audio flag
-        if email.audio_creation_state == 'completed' and email.has_audio:
+        if email.has_audio:
             return jsonify({'status': 'ready'}), 200
+        elif _is_audio_streaming('email', email.id):
+            return jsonify({
+                'status': 'in_progress',
+                'listen_url': url_for('main.listen_email', email_id=email.id)
+            }), 202
         elif email.audio_creation_state == 'started':
             return jsonify({'status': 'in_progress'}), 202
         else:
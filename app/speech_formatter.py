@@ -0,0 +1,160 @@
+"""
+Rule-based conversion of newsletter content to speakable audio scripts, without an LLM.
+
+Scripts keep one markdown heading per section, which the voice generator speaks on its own
+after a pause between sections. Bullet lists become spoken sequences ("First, ... Next, ...
+Finally, ..."), links and images are reduced to their text, bare URLs to their domain, and
+emphasis markers are removed.
+"""
+import re
+from urllib.parse import urlparse
+
+from app.models import Email, Summary
+
+_IMAGE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_URL_RE = re.compile(r'<?(https?://[^\s<>]+)>?')
+# Markers only at word boundaries, so that snake_case names and 2*3 are kept
+_EMPHASIS_RE = re.compile(r'(?<!\w)(\*\*|__|\*|_|`)(?=\S)(.+?)(?<=\S)\1(?!\w)')
+_HEADING_RE = re.compile(r'^#{1,6}\s+(.*)$')
+_BULLET_RE = re.compile(r'^\s*(?:[-*+•]|\d+[.)])\s+(.*)$')
+_RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+# Labels of Summary.to_text(), spoken as headings
+_LABEL_RE = re.compile(r'^(?:Section:\s*(.+)|(Key Points):)$')
+# Headings that only group other sections and have nothing to say themselves
+_GROUPING_HEADINGS = {'topics', 'news', 'sections'}
+# Headings of lists of links, which are not read out
+_SKIPPED_HEADINGS = {'sources', 'links', 'references'}
+
+
+def _spoken_url(match: re.Match) -> str:
+    """The domain of a bare URL, which reads naturally where the URL was, e.g. "more at example.com."."""
+    url = match.group(1)
+    trailing = len(url) - len(url.rstrip('.,;:!?)'))
+    if trailing:
+        url = url[:-trailing]
+    domain = (urlparse(url).hostname or '').removeprefix('www.')
+    return domain + match.group(1)[len(url):]
+
+
+def clean_text(text: str) -> str:
+    """Drop images, keep the text of links, read bare URLs as their domain and remove emphasis markers."""
+    text = _IMAGE_RE.sub('', text)
+    text = _LINK_RE.sub(r'\1', text)
+    text = _URL_RE.sub(_spoken_url, text)
+    text = _EMPHASIS_RE.sub(r'\2', text)
+    return " ".join(text.split())
+
+
+def _sentence(text: str) -> str:
+    text = text.strip()
+    if text and text[-1] not in '.!?…:':
+        text += '.'
+    return text
+
+
+def spoken_list(items: list[str]) -> str:
+    """A list read out as a sequence: "First, a. Next, b. Finally, c."."""
+    items = [_sentence(clean_text(item)) for item in items if clean_text(item)]
+    if len(items) < 2:
+        return " ".join(items)
+    transitions = ['Next', 'Then', 'Also']
+    spoken = []
+    for index, item in enumerate(items):
+        if index == 0:
+            transition = 'First'
+        elif index == len(items) - 1:
+            transition = 'Finally'
+        else:
+            transition = transitions[(index - 1) % len(transitions)]
+        spoken.append(f"{transition}, {item}")
+    return " ".join(spoken)
+
+
+def format_markdown(text: str) -> str:
+    """
+    Turn markdown, or the text of Summary.to_text(), into an audio script.
+
+    Headings are kept as level-2 section headings, except ones that only group other sections;
+    consecutive bullets become one spoken sequence. Source and link lists are left out.
+    """
+    paragraphs = []
+    bullets = []
+    lines = []
+    skipping = False
+
+    def flush():
+        if bullets:
+            paragraphs.append(spoken_list(bullets))
+            bullets.clear()
+        if lines:
+            paragraph = clean_text(" ".join(lines))
+            if paragraph:
+                paragraphs.append(paragraph)
+            lines.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        heading = _HEADING_RE.match(stripped)
+        label = _LABEL_RE.match(stripped)
+        bullet = _BULLET_RE.match(line)
+        if heading or label or _RULE_RE.match(stripped):
+            flush()
+            title = clean_text(heading.group(1) if heading else (label.group(1) or label.group(2)) if label else '')
+            skipping = title.lower().rstrip(':') in _SKIPPED_HEADINGS
+            if title and not skipping and title.lower().rstrip(':') not in _GROUPING_HEADINGS:
+                paragraphs.append(f"## {title}")
+        elif skipping:
+            continue
+        elif stripped.rstrip(':').lower() in _GROUPING_HEADINGS:
+            flush()
+        elif bullet:
+            if lines:
+                flush()
+            bullets.append(bullet.group(1))
+        elif not stripped:
+            flush()
+        elif bullets and line[:1].isspace():
+            # Continuation of the last bullet
+            bullets[-1] += f" {stripped}"
+        else:
+            if bullets:
+                flush()
+            lines.append(stripped)
+    flush()
+    return "\n\n".join(paragraphs)
+
+
+def format_email(email: Email) -> str:
+    """The audio script of an email, from its topics and their news."""
+    topics = list(email.topics)
+    paragraphs = [
+        f"# {clean_text(email.name)}",
+        f"From {email.email_date.strftime('%B %d, %Y')}. "
+        f"This issue covers {len(topics)} topic{'s' if len(topics) != 1 else ''}."
+    ]
+    for topic in topics:
+        paragraphs.append(f"## {clean_text(topic.header)}")
+        summary = format_markdown(topic.summary)
+        if summary:
+            paragraphs.append(summary)
+        if topic.news:
+            paragraphs.append(spoken_list([f"{_sentence(news.title)} {news.content}" for news in topic.news]))
+    return "\n\n".join(paragraphs)
+
+
+def format_summary(summary: Summary) -> str:
+    """The audio script of a summary, from its key points and sections."""
+    paragraphs = [
+        f"# {clean_text(summary.title or 'Summary')}",
+        f"Summary from {summary.from_date.strftime('%B %d, %Y')} to {summary.to_date.strftime('%B %d, %Y')}."
+    ]
+    if summary.key_points:
+        paragraphs.append("## Key points")
+        paragraphs.append(spoken_list([point['text'] for point in summary.key_points]))
+    for section in summary.sections or []:
+        paragraphs.append(f"## {clean_text(section['header'])}")
+        content = format_markdown(section['content'])
+        if content:
+            paragraphs.append(content)
+    return "\n\n".join(paragraphs)
@@ -0,0 +1,128 @@
+import copy
+import hashlib
+import re
+
+import numpy as np
+
+from config import Config
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int) -> set[str]:
+    """Lowercased word n-grams of the text."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class StoryDeduplicator:
+    """
+    Clusters near-duplicate news items using MinHash signatures.
+
+    Each story (title + content) is turned into a set of word shingles, and each set into a
+    signature of `num_perm` minimum hash values. The fraction of equal signature values
+    between two stories estimates the Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, threshold: float = None, num_perm: int = None, shingle_size: int = None, seed: int = 1):
+        self.threshold = threshold if threshold is not None else Config.STORY_DUPLICATE_THRESHOLD
+        self.num_perm = num_perm or Config.STORY_MINHASH_PERMUTATIONS
+        self.shingle_size = shingle_size or Config.STORY_SHINGLE_SIZE
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions: odd 64-bit multipliers and 64-bit offsets
+        self._a = rng.integers(0, np.iinfo(np.uint64).max, size=self.num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+        self._b = rng.integers(0, np.iinfo(np.uint64).max, size=self.num_perm, dtype=np.uint64, endpoint=True)
+
+    def signatures(self, texts: list[str]) -> np.ndarray:
+        """MinHash signatures of the texts, one row per text."""
+        signatures = np.full((len(texts), self.num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+        for row, text in enumerate(texts):
+            shingles = _shingles(text, self.shingle_size)
+            if not shingles:
+                continue
+            hashes = np.fromiter(
+                (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+                dtype=np.uint64,
+                count=len(shingles)
+            )
+            # High 32 bits of (a * h + b) mod 2^64 for every hash function and shingle
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) >> np.uint64(32)
+            signatures[row] = permuted.min(axis=1)
+        return signatures
+
+    def clusters(self, texts: list[str]) -> list[list[int]]:
+        """Group the indexes of near-duplicate texts; every index appears in exactly one cluster."""
+        parent = list(range(len(texts)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        signatures = self.signatures(texts)
+        for i in range(len(texts) - 1):
+            similarity = (signatures[i + 1:] == signatures[i]).mean(axis=1)
+            for j in np.nonzero(similarity >= self.threshold)[0]:
+                parent[find(i + 1 + int(j))] = find(i)
+
+        groups = {}
+        for i in range(len(texts)):
+            groups.setdefault(find(i), []).append(i)
+        return list(groups.values())
+
+
+def dedupe_newsletters(newsletters: list[dict], deduplicator: StoryDeduplicator = None) -> tuple[list[dict], dict]:
+    """
+    Keep one representative of each cluster of near-duplicate news items across newsletters.
+
+    The representative is the longest item of its cluster; it stays where it was and gets an
+    `also_in` list with the names of the other newsletters that covered the story. The other
+    items are dropped. Topics are kept even when all their news items were dropped, since their
+    summary may carry context of its own.
+
+    Parameters:
+    - newsletters: newsletters in the `Email.to_newsletter()` format; they are not modified.
+    - deduplicator: the StoryDeduplicator to use (optional).
+
+    Returns:
+    - list[dict]: the deduplicated newsletters.
+    - dict: 'stories' and 'clusters' counts.
+    """
+    newsletters = copy.deepcopy(newsletters)
+    items = [
+        (newsletter, topic, news)
+        for newsletter in newsletters
+        for topic in newsletter['topics']
+        for news in topic['news']
+    ]
+    if not items:
+        return newsletters, {'stories': 0, 'clusters': 0}
+
+    deduplicator = deduplicator or StoryDeduplicator()
+    clusters = deduplicator.clusters([f"{news['title']} {news['content']}" for _, _, news in items])
+
+    dropped = set()
+    for cluster in clusters:
+        if len(cluster) == 1:
+            continue
+        keep = max(cluster, key=lambda i: len(items[i][2]['content']))
+        representative_newsletter, _, representative = items[keep]
+        also_in = []
+        for i in cluster:
+            if i == keep:
+                continue
+            dropped.add(id(items[i][2]))
+            name = items[i][0]['name']
+            if name != representative_newsletter['name'] and name not in also_in:
+                also_in.append(name)
+        if also_in:
+            representative['also_in'] = also_in
+
+    for newsletter in newsletters:
+        for topic in newsletter['topics']:
+            topic['news'] = [news for news in topic['news'] if id(news) not in dropped]
+
+    return newsletters, {'stories': len(items), 'clusters': len(clusters)}
@@ -1,9 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import time
 from datetime import datetime, timedelta
 import hashlib
+import json
 import logging
 from typing import List
+import tiktoken
 from app.models import AudioFile, Email, News, Newsletter, Source, Summary, Topic, User, db
 from app.mailbox_accessor import MailboxAccessor
+from app.model_router import ModelRouter
+from app.story_dedup import dedupe_newsletters
+from app.text_segmenter import split_at_sections
+from app.topic_clustering import cluster_topics, count_topics
 from bs4 import BeautifulSoup
 import openai
 from pydantic import BaseModel, Field
@@ -52,6 +60,36 @@ def convert_newsletter_to_text(newsletter: EmailModel) -> str:
     
     return text
 
+def _compact(text) -> str:
+    """Collapse all whitespace in a field so it renders on a single line."""
+    return " ".join(str(text).split())
+
+def serialize_newsletters(newsletters: list[dict]) -> str:
+    """
+    Render newsletters in the `Email.to_newsletter()` format as compact structured text.
+
+    The output uses one heading per newsletter and topic and one line per news item, which
+    carries the same information as the Python repr of the dicts without spending tokens on
+    quotes, braces and escaped newlines. Order follows the input, so callers control stability.
+    """
+    lines = []
+    for newsletter in newsletters:
+        lines.append(f"# {_compact(newsletter['name'])}")
+        for topic in newsletter['topics']:
+            lines.append(f"## {_compact(topic['header'])}")
+            if topic['summary']:
+                lines.append(_compact(topic['summary']))
+            for news in topic['news']:
+                line = f"- {_compact(news['title'])}: {_compact(news['content'])}"
+                if news.get('also_in'):
+                    line += f" (also in: {', '.join(news['also_in'])})"
+                lines.append(line)
+    return "\n".join(lines)
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count the tokens `text` uses in the given model's encoding."""
+    return len(tiktoken.encoding_for_model(model).encode(text))
+
 class PointModel(BaseModel):
     text: str = Field(description="A key point covered in the summary")
     
@@ -79,6 +117,27 @@ You are a content editor AI. Your task is to combine the content of a list of ne
 
 Ensure the output remains accurate, coherent, and fully represents the input material. Do not omit any content, do not summarize unless necessary.
 """
+
+# Bump these when the extraction or synthesis prompts or schemas change, so that
+# memoized summaries built with the previous versions are not reused
+EXTRACTION_VERSION = 2
+SYNTHESIS_PROMPT_VERSION = 1
+
+section_prompt = """
+You are a content editor AI. You will be given the topics that a list of newsletters covered on a single theme.
+Write one section of a larger summary about them:
+	•	Header: A clear heading for the theme (e.g., 'AI Developments', 'Hardware and Devices').
+	•	Content: A paragraph-format summary covering all the relevant aspects of the input text. Capture all the content
+	and details; if summarization is required, ensure that no essential information is lost. Note any ambiguities explicitly.
+Maintain a professional tone with clear and organized information.
+"""
+
+overview_prompt = """
+You are a content editor AI. You will be given the sections of a summary of a list of newsletters.
+Provide a title that captures the main topic of the summarized content, the date range it covers, and a bullet-point
+list of the most significant details across all the sections, ensuring no critical information is lost.
+"""
+
 class NewsletterModel(BaseModel):
     newsletters : List[str] = Field(description="A list of newsletters")
        
@@ -92,6 +151,20 @@ class SummaryModel(BaseModel):
     #sources: list[SourceModel] = Field(description="A list of sources used to create the summary")
     #newsletter_names: list[str] = Field(description="A list of newsletter names used to create the summary")
 
+class OverviewModel(BaseModel):
+    date_published: str = Field(description="The date the summary was published")
+    from_to_date: str = Field(description="The date range the summary covers")
+    key_points: list[PointModel] = Field(description="A list of key points covered in the summary")
+    title: str = Field(description="The title of the summary")
+
+def _drain(events):
+    """Exhaust an event generator and return its return value."""
+    while True:
+        try:
+            next(events)
+        except StopIteration as done:
+            return done.value
+
 def convert_summary_to_text(summary: SummaryModel) -> str:
     text = f"Summary\n"
     text += f"Date range: {summary.from_to_date}\n\n"
@@ -121,6 +194,7 @@ def convert_summary_to_text(summary: SummaryModel) -> str:
 class SummaryGenerator:
     def __init__(self):
         self.openai_client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+        self.models = ModelRouter(self.openai_client)
         self.mailslurp_api_key = Config.MAILSLURP_API_KEY
         
     def _get_date_range(self, user_id):
@@ -336,8 +410,8 @@ class SummaryGenerator:
 
                 logging.debug(f"Created email record with unique identifier: {unique_identifier}")
                 logging.debug("Sending to OpenAI for processing...")
-                response = self.openai_client.beta.chat.completions.parse(
-                    model="gpt-4o",
+                response = self.models.parse(
+                    "extraction",
                     messages=[
                         {"role": "system", "content": system_prompt},
                         {"role": "user", "content": email_text}
@@ -448,6 +522,19 @@ class SummaryGenerator:
         Returns:
         - list: A list of IDs of the processed emails stored in the database.
         """
+        return [self.process_email(email, user_id) for email in emails]
+
+    def process_email(self, email, user_id):
+        """
+        Extracts and stores the content of a single email, unless it was already stored.
+
+        Parameters:
+        - email: The MailSlurp email object to be processed.
+        - user_id (int): The ID of the user to whom the email belongs.
+
+        Returns:
+        - int: The ID of the stored email.
+        """
         system_prompt = """
         You are a content editor AI. Your task is to process the text of a newsletter and remove all content related to 
         promotions, advertisements, sponsorships, sales pitches, subscription information, and administrative details. 
@@ -455,149 +542,317 @@ class SummaryGenerator:
         theme or audience. Ensure the resulting output is coherent and focuses solely on newsworthy content.
         """
 
-        email_ids = []
-        for email in emails:
-            email_subject = hashlib.sha256(email.subject.encode('utf-8')).hexdigest()
-            email_from = hashlib.sha256(email._from.encode('utf-8')).hexdigest()
-            email_sender = email._from
-            email_date = str(int(email.created_at.timestamp()))
-            unique_identifier = f"{email_subject}_{email_from}_{email_date}"
-            email_record = Email.query.filter_by(unique_identifier=unique_identifier).first()
-            
-            # If email doesn't already exist in the database, process it
-            if not email_record:
-                logging.debug(f"new email: {email.subject}")
-                # Extract text content from HTML
-                soup = BeautifulSoup(email.body, 'html.parser')
-                email_text = soup.get_text()
-                logging.debug("extracted text")
-                response = self.openai_client.beta.chat.completions.parse(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": email_text}
-                    ],
-                    response_format=EmailModel
-                )
-                
-                email_model = response.choices[0].message.parsed
-                logging.debug("parsed newsletter")
-                
-                # Store the email in the database
-                email_record = Email(
-                    user_id=user_id,
-                    unique_identifier=unique_identifier,
-                    name=email_model.name,
-                    email_date=email.created_at
+        email_subject = hashlib.sha256(email.subject.encode('utf-8')).hexdigest()
+        email_from = hashlib.sha256(email._from.encode('utf-8')).hexdigest()
+        email_date = str(int(email.created_at.timestamp()))
+        unique_identifier = f"{email_subject}_{email_from}_{email_date}"
+        email_record = Email.query.filter_by(unique_identifier=unique_identifier).first()
+        
+        if email_record:
+            logging.debug(f"existing email: {email.subject}")
+            return email_record.id
+
+        # If email doesn't already exist in the database, process it
+        logging.debug(f"new email: {email.subject}")
+        # Extract text content from HTML
+        soup = BeautifulSoup(email.body, 'html.parser')
+        email_text = soup.get_text()
+        logging.debug("extracted text")
+        response = self.models.parse(
+            "extraction",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": email_text}
+            ],
+            response_format=EmailModel
+        )
+        
+        email_model = response.choices[0].message.parsed
+        logging.debug("parsed newsletter")
+        
+        # Store the email in the database
+        email_record = Email(
+            user_id=user_id,
+            unique_identifier=unique_identifier,
+            name=email_model.name,
+            email_date=email.created_at
+        )
+        db.session.add(email_record)
+        for topic in email_model.topics:
+            topic_record = Topic(
+                email=email_record,
+                header=topic.header,
+                summary=topic.summary
+            )
+            db.session.add(topic_record)
+            for news in topic.news:
+                news_record = News(
+                    topic=topic_record,
+                    title=news.title,
+                    content=news.content,
                 )
-                db.session.add(email_record)
-                for topic in email_model.topics:
-                    topic_record = Topic(
-                        email=email_record,
-                        header=topic.header,
-                        summary=topic.summary
-                    )
-                    db.session.add(topic_record)
-                    for news in topic.news:
-                        news_record = News(
-                            topic=topic_record,
-                            title=news.title,
-                            content=news.content,
-                        )
-                        db.session.add(news_record)
-                for source in email_model.sources:
-                    source_record = Source(
-                        email=email_record,
-                        url=source.url,
-                        date=source.date,
-                        title=source.title,
-                        publisher=source.publisher
-                    )
-                    db.session.add(source_record)
-                
-                db.session.commit()
-                db.session.refresh(email_record)
-                id = email_record.id
-                logging.debug(f"saved email")
-            else:
-                id = email_record.id
-                logging.debug(f"existing email: {email.subject}")
-            email_ids.append(id)
-        return email_ids
+                db.session.add(news_record)
+        for source in email_model.sources:
+            source_record = Source(
+                email=email_record,
+                url=source.url,
+                date=source.date,
+                title=source.title,
+                publisher=source.publisher
+            )
+            db.session.add(source_record)
+        
+        db.session.commit()
+        db.session.refresh(email_record)
+        logging.debug(f"saved email")
+        return email_record.id
     
-    def summarize_content(self, email_ids) -> tuple[SummaryModel, list[SourceModel], list[str]]:
+    def _synthesis_input(self, email_ids) -> tuple[list[dict], list[Source], set[str]]:
+        """
+        Load the emails used for a synthesis in a stable order.
 
-        # get all the source content   
-        content = []
+        When `Config.DEDUPLICATE_STORIES` is set, near-duplicate news items are collapsed into one
+        representative that lists the other newsletters covering the story.
+
+        Returns:
+        - newsletters: the `Email.to_newsletter()` dicts, ordered by email date then id.
+        - sources: the unique sources across the emails, keyed by url.
+        - newsletter_names: the set of newsletter names.
+        """
+        newsletters = []
         sources = {}
         newsletter_names = set()
-        emails = Email.query.filter(Email.id.in_(email_ids)).all()
+        emails = Email.query.filter(Email.id.in_(email_ids))\
+            .order_by(Email.email_date, Email.id)\
+            .all()
         for email in emails:
             logging.info(f"email: {email.name}")
-            content.append(f"newsletter: {email.name}\n{email.to_newsletter()}")
+            newsletters.append(email.to_newsletter())
             newsletter_names.add(email.name)
             for source in email.sources:
                 if source.url not in sources:
                     sources[source.url] = source
+        if Config.DEDUPLICATE_STORIES:
+            newsletters, stats = dedupe_newsletters(newsletters)
+            logging.info(f"Collapsed {stats['stories']} stories into {stats['clusters']}")
+        return newsletters, list(sources.values()), newsletter_names
+
+    def summarize_content(self, email_ids) -> tuple[SummaryModel, list[SourceModel], list[str]]:
 
-        parsed = self.openai_client.beta.chat.completions.parse(
-            model="gpt-4o",
+        # get all the source content   
+        newsletters, sources, newsletter_names = self._synthesis_input(email_ids)
+
+        parsed = self.models.parse(
+            "synthesis",
             messages=[
                 {"role": "system", "content": synthesis_prompt},
-                {"role": "user", "content": str(content)}
+                {"role": "user", "content": serialize_newsletters(newsletters)}
             ],
             response_format=SummaryModel
         )
         logging.info(f"parsed summary")
         summary = parsed.choices[0].message.parsed
-        sources = list(sources.values())
         return summary, sources, newsletter_names
     
     
-    def synthesis(self, email_ids) -> tuple[SummaryModel, list[SourceModel], list[str]]:
+    def synthesis_fingerprint(self, email_ids) -> str:
+        """
+        Fingerprint of everything a synthesis depends on.
+
+        Covers the sorted email ids, the extraction version and a digest of the extracted content of
+        those emails, the synthesis prompt version, the models of both the single-completion and the
+        per-section synthesis, and the synthesis options. Two summaries with the same fingerprint
+        would be synthesized from identical input.
+        """
+        emails = Email.query.filter(Email.id.in_(email_ids)).order_by(Email.id).all()
+        extracted = serialize_newsletters([email.to_newsletter() for email in emails])
+        payload = {
+            'email_ids': sorted(email_ids),
+            'extraction_version': EXTRACTION_VERSION,
+            'extraction_digest': hashlib.sha256(extracted.encode('utf-8')).hexdigest(),
+            'prompt_version': SYNTHESIS_PROMPT_VERSION,
+            'models': {
+                call_site: self.models.model(call_site)
+                for call_site in ("synthesis", "synthesis_section", "synthesis_overview")
+            },
+            'options': {
+                'deduplicate_stories': Config.DEDUPLICATE_STORIES,
+                'parallel_synthesis_min_topics': Config.PARALLEL_SYNTHESIS_MIN_TOPICS,
+                'section_similarity_threshold': Config.SECTION_SIMILARITY_THRESHOLD,
+                'max_synthesis_sections': Config.MAX_SYNTHESIS_SECTIONS,
+            },
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _memoized_synthesis(self, fingerprint) -> tuple[SummaryModel, list[SourceModel], list[str]] | None:
+        """The synthesis result stored on the latest completed summary with this fingerprint, if any."""
+        cached = Summary.query.filter(
+            Summary.input_fingerprint == fingerprint,
+            Summary.status == 'completed'
+        ).order_by(Summary.created_at.desc()).first()
+        if not cached:
+            return None
+
+        logging.info(f"Reusing synthesis of summary {cached.id}")
+        summary = SummaryModel(
+            date_published=str(cached.date_published or ""),
+            from_to_date=f"{cached.from_date.strftime('%Y-%m-%d')} to {cached.to_date.strftime('%Y-%m-%d')}",
+            key_points=[PointModel(text=point['text']) for point in cached.key_points or []],
+            title=cached.title or "",
+            sections=[SectionModel(header=section['header'], content=section['content']) for section in cached.sections or []],
+        )
+        sources = [SourceModel(**source) for source in cached.sources or []]
+        return summary, sources, set(cached.newsletter_names or [])
+
+    def synthesis(self, email_ids, force=False, fingerprint=None) -> tuple[SummaryModel, list[SourceModel], list[str]]:
+        """
+        Synthesize a summary of the given emails.
+
+        Unless `force` is set, the result of a completed summary with the same input fingerprint is
+        reused instead of calling the model. Pass `fingerprint` when it was already computed.
+        """
+        fingerprint = fingerprint or self.synthesis_fingerprint(email_ids)
+        if not force:
+            memoized = self._memoized_synthesis(fingerprint)
+            if memoized:
+                return memoized
 
         # get all the source content   
-        content = []
-        sources = {}
-        newsletter_names = set()
-        emails = Email.query.filter(Email.id.in_(email_ids)).all()
-        for email in emails:
-            logging.info(f"email: {email.name}")
-            content.append(email.to_newsletter())
-            newsletter_names.add(email.name)
-            for source in email.sources:
-                if source.url not in sources:
-                    sources[source.url] = source
+        newsletters, sources, newsletter_names = self._synthesis_input(email_ids)
+
+        if self._use_parallel_synthesis(newsletters):
+            summary = _drain(self._parallel_synthesis(newsletters))
+            return summary, sources, newsletter_names
 
-        parsed = self.openai_client.beta.chat.completions.parse(
-            model="gpt-4o",
+        parsed = self.models.parse(
+            "synthesis",
             messages=[
                 {"role": "system", "content": synthesis_prompt},
-                {"role": "user", "content": str(content)}
+                {"role": "user", "content": serialize_newsletters(newsletters)}
             ],
             response_format=SummaryModel
         )
         logging.info(f"parsed summary")
         summary = parsed.choices[0].message.parsed
-        sources = list(sources.values())
         return summary, sources, newsletter_names
     
 
     
-    def generate_summary(self, user_id, new_summary, start_date = None, end_date = None) -> Summary:
+    def synthesis_stream(self, email_ids, force=False, fingerprint=None):
         """
-        Generates a summary for a given user within a specified date range.
-        
-        This function fetches emails, processes them, synthesizes a summary, and updates the summary record.
-        
-        Parameters:
-        - user_id: The ID of the user for whom the summary is being generated.
-        - new_summary: The Summary object to be updated with the generated summary details.
-        - start_date: The start date for fetching emails (optional).
-        - end_date: The end date for fetching emails (optional).
-        
-        Returns:
-        - Summary: The updated Summary object with the generated summary details.
+        Streaming variant of `synthesis`.
+
+        Yields a `('section', {'header', 'content'})` event for each section of the summary as soon
+        as the model has finished writing it, and returns the same `(summary, sources, newsletter_names)`
+        tuple as `synthesis` once the completion is done. Use it with `yield from`.
+        """
+        fingerprint = fingerprint or self.synthesis_fingerprint(email_ids)
+        if not force:
+            memoized = self._memoized_synthesis(fingerprint)
+            if memoized:
+                for section in memoized[0].sections:
+                    yield 'section', {"header": section.header, "content": section.content}
+                return memoized
+
+        newsletters, sources, newsletter_names = self._synthesis_input(email_ids)
+
+        if self._use_parallel_synthesis(newsletters):
+            summary = yield from self._parallel_synthesis(newsletters)
+            return summary, sources, newsletter_names
+
+        emitted = 0
+        with self.models.stream(
+            "synthesis",
+            messages=[
+                {"role": "system", "content": synthesis_prompt},
+                {"role": "user", "content": serialize_newsletters(newsletters)}
+            ],
+            response_format=SummaryModel
+        ) as stream:
+            for event in stream:
+                if event.type != "content.delta" or not isinstance(event.parsed, dict):
+                    continue
+                # Every section but the last one in the partial output is complete
+                sections = event.parsed.get("sections") or []
+                while emitted < len(sections) - 1:
+                    yield 'section', {"header": sections[emitted]["header"], "content": sections[emitted]["content"]}
+                    emitted += 1
+            completion = stream.get_final_completion()
+
+        logging.info(f"parsed summary")
+        summary = completion.choices[0].message.parsed
+        for section in summary.sections[emitted:]:
+            yield 'section', {"header": section.header, "content": section.content}
+        return summary, sources, newsletter_names
+
+    def _use_parallel_synthesis(self, newsletters) -> bool:
+        return count_topics(newsletters) >= Config.PARALLEL_SYNTHESIS_MIN_TOPICS
+
+    def _parallel_synthesis(self, newsletters):
+        """
+        Synthesize a summary one thematic section at a time.
+
+        Topics are clustered locally into sections, every section is written concurrently by its own
+        smaller completion, and a final pass over the written sections produces the title and key
+        points. Yields a `('section', {'header', 'content'})` event per section, in order, and
+        returns the SummaryModel.
+        """
+        section_inputs = cluster_topics(newsletters)
+        logging.info(f"Clustered {count_topics(newsletters)} topics into {len(section_inputs)} sections")
+
+        sections = []
+        with ThreadPoolExecutor(max_workers=Config.SYNTHESIS_MAX_WORKERS) as executor:
+            futures = [executor.submit(self._synthesize_section, section_input) for section_input in section_inputs]
+            for future in futures:
+                section = future.result()
+                sections.append(section)
+                yield 'section', {"header": section.header, "content": section.content}
+
+        overview = self._synthesize_overview(sections)
+        logging.info(f"parsed summary")
+        return SummaryModel(
+            date_published=overview.date_published,
+            from_to_date=overview.from_to_date,
+            key_points=overview.key_points,
+            title=overview.title,
+            sections=sections
+        )
+
+    def _synthesize_section(self, newsletters) -> SectionModel:
+        parsed = self.models.parse(
+            "synthesis_section",
+            messages=[
+                {"role": "system", "content": section_prompt},
+                {"role": "user", "content": serialize_newsletters(newsletters)}
+            ],
+            response_format=SectionModel
+        )
+        return parsed.choices[0].message.parsed
+
+    def _synthesize_overview(self, sections: list[SectionModel]) -> OverviewModel:
+        content = "\n\n".join(f"## {section.header}\n{section.content}" for section in sections)
+        parsed = self.models.parse(
+            "synthesis_overview",
+            messages=[
+                {"role": "system", "content": overview_prompt},
+                {"role": "user", "content": content}
+            ],
+            response_format=OverviewModel
+        )
+        return parsed.choices[0].message.parsed
+
+    def generate_summary_events(self, user_id, new_summary, start_date = None, end_date = None, force = False):
+        """
+        Generates a summary like `generate_summary`, reporting progress as it goes.
+
+        Yields `(event, data)` tuples:
+        - ('fetched', {'count'}): emails were fetched from the mailbox.
+        - ('extracted', {'done', 'total'}): one more email was extracted.
+        - ('section', {'header', 'content'}): a summary section finished streaming.
+        - ('completed', {'title', 'key_points'}): `new_summary` has been filled in.
+
+        Synthesis is skipped when a completed summary has the same input fingerprint, unless `force`
+        is set. The caller is responsible for committing `new_summary`.
         """
         user = User.query.get(user_id)
         inbox_id = user.mailslurp_inbox_id
@@ -611,11 +866,16 @@ class SummaryGenerator:
         if len(emails) == 0:
             logging.info(f"No emails found")
             raise Exception("No emails found")
+        yield 'fetched', {'count': len(emails)}
         
-        email_ids = self.process_emails(emails, user_id)
+        email_ids = []
+        for email in emails:
+            email_ids.append(self.process_email(email, user_id))
+            yield 'extracted', {'done': len(email_ids), 'total': len(emails)}
         logging.info(f"Processed content: {email_ids}")
         
-        summary, sources, newsletter_names = self.synthesis(email_ids)
+        fingerprint = self.synthesis_fingerprint(email_ids)
+        summary, sources, newsletter_names = yield from self.synthesis_stream(email_ids, force=force, fingerprint=fingerprint)
         logging.info(f"Synthesized summary")
         
         new_summary.title = "Summary of your newsletters"
@@ -630,6 +890,28 @@ class SummaryGenerator:
         new_summary.sources = [{"url": source.url, "date": source.date, "title": source.title, "publisher": source.publisher} for source in sources]
         new_summary.newsletter_names = list(newsletter_names)   
         new_summary.email_ids = email_ids
+        new_summary.input_fingerprint = fingerprint
+        yield 'completed', {'title': new_summary.title, 'key_points': new_summary.key_points}
+
+    def generate_summary(self, user_id, new_summary, start_date = None, end_date = None, force = False) -> Summary:
+        """
+        Generates a summary for a given user within a specified date range.
+        
+        This function fetches emails, processes them, synthesizes a summary, and updates the summary record.
+        It runs `generate_summary_events` to completion; use that directly to report progress.
+        
+        Parameters:
+        - user_id: The ID of the user for whom the summary is being generated.
+        - new_summary: The Summary object to be updated with the generated summary details.
+        - start_date: The start date for fetching emails (optional).
+        - end_date: The end date for fetching emails (optional).
+        - force: Synthesize even if a summary with the same inputs already exists (optional).
+        
+        Returns:
+        - Summary: The updated Summary object with the generated summary details.
+        """
+        for _event, _data in self.generate_summary_events(user_id, new_summary, start_date, end_date, force):
+            pass
         # Add the new summary to the database
         return new_summary
     
@@ -680,22 +962,73 @@ class SummaryGenerator:
 
     
 
-    def convert_to_audio_format(self, email_text: str) -> str:
-        """Convert email content to a more audio-friendly format using OpenAI."""
-        system_prompt = """
-        You are an AI assistant that converts newsletter content into a natural, 
+    def convert_to_audio_format(self, email_text: str, content_type: str = 'email') -> str:
+        """Convert email content, or a summary with `content_type='summary'`, to a more audio-friendly format using OpenAI."""
+        return "\n\n".join(self.convert_to_audio_format_chunks(email_text, content_type=content_type))
+
+    def convert_to_audio_format_chunks(self, email_text: str, fallback=None, content_type: str = 'email'):
+        """
+        Convert content to an audio-friendly format a chunk at a time.
+        
+        The content is split at section boundaries into chunks of about
+        Config.AUDIO_SCRIPT_CHUNK_CHARS characters, which are converted concurrently. Yields the
+        converted chunks in order, each as soon as it and the ones before it are done, so that
+        speech synthesis can start before the whole script is written.
+        
+        Args:
+            email_text: The content to convert
+            fallback: Optional `fallback(chunk) -> str` used for the chunks whose conversion fails,
+                or is not done Config.AUDIO_SCRIPT_FALLBACK_TIMEOUT seconds after the start
+            content_type: 'email' for the content of a newsletter, 'summary' for a summary of several
+        """
+        chunks = split_at_sections(email_text, Config.AUDIO_SCRIPT_CHUNK_CHARS)
+        if len(chunks) > 1:
+            logging.info(f"Converting {len(email_text)} characters to an audio script in {len(chunks)} chunks")
+        deadline = time.monotonic() + Config.AUDIO_SCRIPT_FALLBACK_TIMEOUT if fallback and Config.AUDIO_SCRIPT_FALLBACK_TIMEOUT else None
+        executor = ThreadPoolExecutor(max_workers=Config.AUDIO_SCRIPT_MAX_WORKERS)
+        try:
+            futures = [executor.submit(self._convert_audio_chunk, chunk, index, len(chunks), content_type) for index, chunk in enumerate(chunks)]
+            for chunk, future in zip(chunks, futures):
+                if not fallback:
+                    yield future.result()
+                    continue
+                try:
+                    yield future.result(timeout=max(0, deadline - time.monotonic()) if deadline else None)
+                except FutureTimeoutError:
+                    logging.warning(f"Audio script conversion is too slow, formatting a chunk of {len(chunk)} characters with rules")
+                    yield fallback(chunk)
+                except Exception as e:
+                    logging.warning(f"Audio script conversion failed ({e}), formatting a chunk of {len(chunk)} characters with rules")
+                    yield fallback(chunk)
+        finally:
+            # Do not wait for conversions that were replaced by the fallback
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _convert_audio_chunk(self, text: str, index: int = 0, count: int = 1, content_type: str = 'email') -> str:
+        content = "a summary of several newsletters" if content_type == 'summary' else "newsletter content"
+        system_prompt = f"""
+        You are an AI assistant that converts {content} into a natural, 
         conversational format suitable for text-to-speech. Your task is to:
         1. Maintain the key information and structure
         2. Make the text flow naturally when read aloud
         3. Convert any visual elements (bullets, formatting) into spoken transitions
         4. Add appropriate pauses and transitions between sections
         """
+        if count > 1:
+            system_prompt += f"""
+        The content is part {index + 1} of {count} of a longer text; the parts are converted separately
+        and read back to back. Keep the section headings on their own lines.
+        """
+            if index > 0:
+                system_prompt += "Do not greet the listener or introduce the text: continue from the previous part.\n"
+            if index < count - 1:
+                system_prompt += "Do not conclude or sign off: another part follows.\n"
         
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o",
+        response = self.models.create(
+            "audio_script",
             messages=[
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": email_text}
+                {"role": "user", "content": text}
             ]
         )
         
@@ -722,8 +1055,8 @@ class SummaryGenerator:
             ```
         
         """
-        parsed = self.openai_client.beta.chat.completions.parse(
-            model="gpt-4o",
+        parsed = self.models.parse(
+            "sender_detection",
             messages=[
                 {"role": "system", "content": prompt},
                 {"role": "user", "content": f'email: {email_raw}'}
@@ -741,8 +1074,8 @@ class SummaryGenerator:
          
          Newsletters names: {", ".join([newsletter.name for newsletter in newsletters])}
         """
-        parsed = self.openai_client.beta.chat.completions.parse(
-            model="gpt-4o",
+        parsed = self.models.parse(
+            "newsletter_name",
             messages=[
                 {"role": "system", "content": prompt},
                 {"role": "user", "content": f'email subject: {email_subject}, email sender: {email_sender}'}
@@ -6,13 +6,16 @@ import logging
 from pydantic import BaseModel
 from app import create_app
 from app.mailbox_accessor import MailboxAccessor
-from app.models import AudioFile, News, Source, Topic, User, Summary, db, TaskExecution, Newsletter, Email
+from app.audio_demand import estimated_tts_cost, on_demand_hit_rate, select_emails_to_prerender
+from app.models import News, Source, Topic, User, Summary, db, TaskExecution, Newsletter, Email
 from app.summary_generator import SummaryGenerator, convert_summary_to_text
 from app.email_sender import EmailSender
 from flask import render_template, url_for
 from app.voice_generator import VoiceClipGenerator
 from app.models import Email
+from app.request_queue import LOW_PRIORITY, enqueue_request, unfinished_request
 import os
+from config import Config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,7 +25,7 @@ def generate_daily_summaries():
     Generate summaries for all active users and notify them by email.
     This function is meant to be called daily by a cron job.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         try:
@@ -103,11 +106,10 @@ def generate_email_audio():
     Generate audio versions of emails that don't have audio yet.
     This function:
     1. Finds all emails without audio
-    2. Converts their content to an audio-friendly format
-    3. Generates audio files using text-to-speech
-    4. Updates the email records with audio file info
+    2. Keeps the ones the user is likely to listen to; the others are generated on demand
+    3. Queues their audio generation in the low-priority lane, behind the requests users are waiting on
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     with app.app_context():
         # Get all emails that don't have audio yet
         pending_emails = Email.query.join(
@@ -122,9 +124,29 @@ def generate_email_audio():
         
         logger.info(f"Found {len(pending_emails)} emails pending audio generation: {', '.join([pending_email.name for pending_email in pending_emails])}")
         
-        voice_generator = VoiceClipGenerator()
-        for email in pending_emails:
-            voice_generator.email_to_audio(email)
+        prerender, skipped = select_emails_to_prerender(pending_emails)
+        # Emails stay pending for a day: count the savings of each one once, and not for emails
+        # whose audio a user already asked for
+        newly_skipped = [email for email in skipped if email.audio_creation_state in (None, 'none')]
+        saved = sum(estimated_tts_cost(email) for email in newly_skipped)
+        for email in newly_skipped:
+            email.audio_creation_state = 'skipped'
+        hits, listened = on_demand_hit_rate()
+        logger.info(f"Pre-rendering audio for {len(prerender)} emails, leaving {len(skipped)} for on demand "
+                    f"(about ${saved:.2f} of TTS saved on {len(newly_skipped)} new ones)")
+        if listened:
+            logger.info(f"{hits} of {listened} emails listened to in the last "
+                        f"{Config.AUDIO_DEMAND_HISTORY_DAYS} days had their audio ready ({hits / listened:.0%} hit rate)")
+        
+        queued = 0
+        for email in prerender:
+            if unfinished_request('audio', email_id=email.id):
+                continue
+            enqueue_request(email_id=email.id, type='audio', priority=LOW_PRIORITY)
+            email.audio_creation_state = 'started'
+            queued += 1
+        db.session.commit()
+        logger.info(f"Queued audio generation for {queued} emails")
 
 def collect_summarize_and_voice_emails():
     """
@@ -134,7 +156,7 @@ def collect_summarize_and_voice_emails():
     2. Collects and summarizes emails for each user.
     3. Updates task execution status and records any failures.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         failures = 0
@@ -194,7 +216,7 @@ def process_inbox_emails():
     4. Stores the processed content in the database.
     5. Updates task execution status and records any failures.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         failures = 0
@@ -232,7 +254,7 @@ def identify_newsletter_name():
     Process emails to identify newsletter names.
     This function is meant to be called when needed to identify newsletter names.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         try:
@@ -279,7 +301,7 @@ def create_newsletters_from_emails():
     Task to create Newsletter records from existing Email records.
     This task looks for emails without corresponding newsletter records and creates them.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         logging.info("Starting create_newsletters_from_emails task")
@@ -334,7 +356,7 @@ def recreate_newsletters_from_inbox():
     3. Creates Newsletter records based on unique sender addresses
     4. Replaces existing newsletter records for the user
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         logger.info("Starting recreate_newsletters_from_inbox task")
@@ -402,7 +424,7 @@ def delete_emails_without_audio():
     2. Deletes them from the database
     3. Records the execution status
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         logger.info("Starting delete_emails_without_audio task")
@@ -455,7 +477,7 @@ def print_last_email(user_id):
     Args:
         user_id: The ID of the user whose inbox should be checked
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         try:
@@ -503,7 +525,7 @@ def list_users():
     """
     List all users in the system with their IDs and email addresses.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         try:
@@ -536,7 +558,7 @@ def generate_weekly_summaries():
     Generate weekly summaries for all active users and notify them by email.
     This function is meant to be called weekly by a cron job.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         try:
@@ -597,7 +619,8 @@ def generate_weekly_summaries():
                         continue
                     
                     email_ids = [email.id for email in emails]
-                    summary, sources, newsletter_names = summary_generator.synthesis(email_ids)                    
+                    fingerprint = summary_generator.synthesis_fingerprint(email_ids)
+                    summary, sources, newsletter_names = summary_generator.synthesis(email_ids, fingerprint=fingerprint)
 
                     logging.info(f"Synthesized summary")
                     
@@ -613,6 +636,7 @@ def generate_weekly_summaries():
                     new_summary.sources = [{"url": source.url, "date": source.date, "title": source.title, "publisher": source.publisher} for source in sources]
                     new_summary.newsletter_names = list(newsletter_names)   
                     new_summary.email_ids = email_ids
+                    new_summary.input_fingerprint = fingerprint
                     # Add the new summary to the database
                     db.session.add(new_summary)
                     db.session.commit()
@@ -658,71 +682,29 @@ def generate_summary_audio():
     Generate audio versions of summaries that don't have audio yet.
     This function:
     1. Finds all summaries without audio and not older than 2 weeks
-    2. Converts their content to an audio-friendly format
-    3. Generates audio files using text-to-speech
-    4. Updates the summary records with audio file info
+    2. Queues their audio generation in the low-priority lane, behind the requests users are waiting on
+    The workers convert each summary to an audio-friendly format, generate its audio with
+    text-to-speech and update the summary records with audio file info.
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     with app.app_context():
-        # Get all users
-        users = User.query.all()
-        logger.info(f"Found {len(users)} users to process summaries for audio generation")
+        # Get all summaries that don't have audio yet and are not older than 2 weeks
+        two_weeks_ago = datetime.now() - timedelta(weeks=2)
+        pending_summaries = Summary.query.filter(
+            Summary.has_audio == False,
+            Summary.to_date >= two_weeks_ago
+        ).all()
+        logger.info(f"Found {len(pending_summaries)} summaries pending audio generation.")
+
+        queued = 0
+        for summary in pending_summaries:
+            if unfinished_request('summary_audio', summary_id=summary.id):
+                continue
+            enqueue_request(summary_id=summary.id, type='summary_audio', priority=LOW_PRIORITY)
+            queued += 1
+        db.session.commit()
+        logger.info(f"Queued audio generation for {queued} summaries")
 
-        for user in users:
-            logger.info(f"Processing summaries for user {user.id}")
-            # Get all summaries that don't have audio yet and are not older than 2 weeks
-            two_weeks_ago = datetime.now() - timedelta(weeks=2)
-            pending_summaries = Summary.query.filter(
-                Summary.has_audio == False,
-                Summary.to_date >= two_weeks_ago
-            ).all()
-            
-            logger.info(f"Found {len(pending_summaries)} summaries pending audio generation.")
-            summary_generator = SummaryGenerator()
-            for summary in pending_summaries:
-                if not summary.audio_text:
-                    # Convert summary content to audio-friendly format
-                    summary_speech_text = summary_generator.convert_to_audio_format(str(summary))
-                    summary.audio_text = summary_speech_text
-                    db.session.commit()
-                    logger.info(f"Converted summary {summary.id} to speech text")
-                
-            voice_generator = VoiceClipGenerator()
-            for summary in pending_summaries:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                audio_filename = f"summary_{summary.id}_{timestamp}.mp3"
-                #audio_path = os.path.join(app.config['AUDIO_DIR'], audio_filename)
-                logging.info(f"Generated audio filename: {audio_filename}")
-                
-                # Generate audio file
-                logging.info(f"Generating audio file for summary {summary.id}")
-                voice_data = voice_generator.openai_text_to_speech(summary.audio_text, content_type="speech_summary")
-                
-                
-                if voice_data:
-                    # Update email record
-                    logging.info(f"Successfully generated audio for summary {summary.id}, updating database record")
-                    summary.has_audio = True
-                    # Create or update AudioFile record
-                    audio_file = AudioFile.query.filter_by(summary_id=summary.id).first()
-                    if audio_file:
-                        audio_file.filename = audio_filename
-                        audio_file.data = voice_data
-                    else:
-                        audio_file = AudioFile(
-                            filename=audio_filename,
-                            data=voice_data,
-                            summary_id=summary.id
-                        )
-                        db.session.add(audio_file)
-                    db.session.commit()
-                    logging.info(f"Database record updated for summary {summary.id}")
-                    return True
-                else:
-                    logging.info(f"Failed to generate audio for summary {summary.id}")
-                    return False
-                    
-                    
 
 def process_recent_emails_and_create_newsletters():
     """
@@ -733,7 +715,7 @@ def process_recent_emails_and_create_newsletters():
     3. For each email, identifies the newsletter name
     4. Creates newsletter records if they don't already exist
     """
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     with app.app_context():
         logger.info("Starting process_recent_emails_and_create_newsletters task")
@@ -0,0 +1,100 @@
+import re
+
+# A sentence ends with terminal punctuation, optionally followed by closing quotes or brackets
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?…])["\'”’)\]]*\s+')
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+# Lines starting a section: markdown headings down to level 3, and the labels of Summary.to_text()
+_SECTION_START_RE = re.compile(r'^(?=#{1,3} |Section: |Key Points:|Sections:)', re.MULTILINE)
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split a paragraph into sentences, keeping their punctuation."""
+    return [sentence.strip() for sentence in _SENTENCE_END_RE.split(text) if sentence.strip()]
+
+
+def _split_words(text: str, max_chars: int) -> list[str]:
+    """Split text that has no usable sentence boundary at word boundaries."""
+    chunks = []
+    current = ""
+    for word in text.split():
+        while len(word) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(word[:max_chars])
+            word = word[max_chars:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > max_chars:
+            chunks.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def pack_section(text: str, max_chars: int) -> list[str]:
+    """
+    Pack the text of one section into as few chunks of at most `max_chars` characters as possible.
+
+    Chunks break between paragraphs where they can, otherwise between sentences, and only
+    split a sentence at word boundaries when it is longer than `max_chars` on its own.
+    Paragraph breaks inside a chunk are kept so the speech still pauses naturally there.
+    """
+    chunks = []
+    current = ""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        separator = "\n\n"
+        pieces = [paragraph] if len(paragraph) <= max_chars else split_sentences(paragraph)
+        for piece in pieces:
+            for part in ([piece] if len(piece) <= max_chars else _split_words(piece, max_chars)):
+                candidate = f"{current}{separator}{part}" if current else part
+                if len(candidate) > max_chars:
+                    chunks.append(current)
+                    current = part
+                else:
+                    current = candidate
+                separator = " "
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_at_sections(text: str, max_chars: int) -> list[str]:
+    """
+    Split a document into chunks at section starts, merging consecutive sections while the
+    chunk stays within `max_chars` characters.
+
+    A section longer than `max_chars` is kept whole in its own chunk.
+    """
+    chunks = []
+    current = ""
+    for section in _SECTION_START_RE.split(text):
+        if not section.strip():
+            continue
+        if current and len(current) + len(section) > max_chars:
+            chunks.append(current)
+            current = section
+        else:
+            current += section
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def pack_sections(sections: list[str], max_chars: int) -> list[list[str]]:
+    """
+    Pack each section into chunks of at most `max_chars` characters.
+
+    Sections are never merged, so that pauses can be inserted at section boundaries;
+    empty sections are dropped.
+
+    Returns:
+        list[list[str]]: the chunks of each non-empty section, in order.
+    """
+    packed = [pack_section(section, max_chars) for section in sections]
+    return [chunks for chunks in packed if chunks]
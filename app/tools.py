@@ -1,9 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import tempfile
+import time
 from flask import current_app, Flask
-from app.models import Summary, User, db
+from app.audio_storage import FilesystemAudioStorage, get_audio_storage
+from app.audio_renditions import create_renditions
+from app.models import AudioFile, AudioRendition, Email, Summary, User, db
+from app.tts_providers import get_tts_provider
 from app.voice_generator import VoiceClipGenerator
-from app.summary_generator import SummaryGenerator
+from app.summary_generator import SummaryGenerator, count_tokens, serialize_newsletters
+from app.story_dedup import dedupe_newsletters
 from app.mailbox_accessor import MailboxAccessor
 from app.email_sender import EmailSender
 from config import Config
@@ -111,12 +117,15 @@ def eleven_labs_synthesize_summary(summary_id):
         return False
 
 
-def re_generate_summary(summary_id):
+def re_generate_summary(summary_id, force=False):
     """
     Regenerate an existing summary while keeping the same email sources.
     
+    The summary is left untouched when its inputs have not changed since it was synthesized.
+    
     Args:
         summary_id: ID of the summary to regenerate
+        force: Regenerate even if the inputs are unchanged
     """
     try:
         new_summary = Summary.query.get(summary_id)
@@ -128,9 +137,15 @@ def re_generate_summary(summary_id):
         logger.info(f"Regenerating summary {summary_id} with {len(email_ids)} emails")
 
         summary_generator = SummaryGenerator()
-        summary, sources, newsletter_names = summary_generator.synthesis(email_ids)
+        fingerprint = summary_generator.synthesis_fingerprint(email_ids)
+        if not force and new_summary.input_fingerprint == fingerprint:
+            logger.info(f"Inputs of summary {summary_id} are unchanged, use --force to regenerate it anyway")
+            return True
+
+        summary, sources, newsletter_names = summary_generator.synthesis(email_ids, force=force, fingerprint=fingerprint)
         logger.info(f"Synthesized summary {summary}")
             
+        new_summary.input_fingerprint = fingerprint
         new_summary.title = summary.title
         new_summary.date_published = datetime.now()
         new_summary.key_points = [{"text": point.text} for point in summary.key_points]
@@ -164,21 +179,192 @@ def re_generate_summary_audio(summary_id):
         return False
 
 
+def prompt_token_report(days=7):
+    """
+    Compare synthesis prompt sizes for the repr-based and compact serializations.
+    
+    Args:
+        days: Number of days of stored, non-excluded emails to use as the sample corpus
+    """
+    since = datetime.now() - timedelta(days=days)
+    emails = Email.query.filter(
+        Email.is_excluded == False,
+        Email.created_at >= since
+    ).order_by(Email.email_date, Email.id).all()
+    if not emails:
+        logger.info(f"No emails found in the last {days} days")
+        return None
+
+    newsletters = [email.to_newsletter() for email in emails]
+    before = count_tokens(str(newsletters))
+    after = count_tokens(serialize_newsletters(newsletters))
+    saved = (1 - after / before) * 100 if before else 0
+    logger.info(f"Prompt tokens for {len(emails)} emails over {days} days: "
+                f"repr={before}, compact={after} ({saved:.1f}% fewer)")
+    return before, after
+
+
+def dedup_report(user_id, days=7):
+    """
+    Report how much near-duplicate story elimination shrinks a user's synthesis prompt.
+    
+    Args:
+        user_id: ID of the user whose emails to use
+        days: Number of days of stored, non-excluded emails to use, a week by default
+    """
+    since = datetime.now() - timedelta(days=days)
+    emails = Email.query.filter(
+        Email.user_id == user_id,
+        Email.is_excluded == False,
+        Email.created_at >= since
+    ).order_by(Email.email_date, Email.id).all()
+    if not emails:
+        logger.info(f"No emails found for user {user_id} in the last {days} days")
+        return None
+
+    newsletters = [email.to_newsletter() for email in emails]
+    deduped, stats = dedupe_newsletters(newsletters)
+    before = count_tokens(serialize_newsletters(newsletters))
+    after = count_tokens(serialize_newsletters(deduped))
+    saved = (1 - after / before) * 100 if before else 0
+    logger.info(f"{len(emails)} emails, {stats['stories']} stories in {stats['clusters']} clusters")
+    logger.info(f"Prompt tokens: {before} before, {after} after deduplication ({saved:.1f}% fewer)")
+    return before, after
+
+
+def migrate_audio_storage():
+    """
+    Move audio stored inline in audio_file rows to the audio storage backend.
+    
+    Rows are migrated one at a time so that a single blob is held in memory at once;
+    identical audio ends up stored once.
+    """
+    ids = [row.id for row in db.session.query(AudioFile.id).filter(AudioFile.data.isnot(None)).order_by(AudioFile.id)]
+    logger.info(f"Moving {len(ids)} audio files to {Config.AUDIO_STORAGE_BACKEND} storage")
+    moved_bytes = 0
+    for audio_file_id in ids:
+        audio_file = AudioFile.query.get(audio_file_id)
+        data = audio_file.data
+        audio_file.set_audio(data)
+        storage_key = audio_file.storage_key
+        db.session.commit()
+        db.session.expunge(audio_file)
+        moved_bytes += len(data)
+        logger.info(f"Moved audio file {audio_file_id} ({len(data)} bytes) to {storage_key}")
+    logger.info(f"Moved {len(ids)} audio files, {moved_bytes} bytes")
+    return len(ids)
+
+
+def gc_audio_storage(dry_run=True):
+    """Delete stored audio that no audio_file row references any more."""
+    storage = get_audio_storage()
+    referenced = {row.storage_key for row in db.session.query(AudioFile.storage_key).filter(AudioFile.storage_key.isnot(None))}
+    referenced.update(row.storage_key for row in db.session.query(AudioRendition.storage_key))
+    orphans = [key for key in storage.keys() if key not in referenced]
+    for key in orphans:
+        if dry_run:
+            logger.info(f"Would delete {key}")
+        else:
+            storage.delete(key)
+    logger.info(f"{'Found' if dry_run else 'Deleted'} {len(orphans)} unreferenced audio objects")
+    return orphans
+
+
+def create_audio_renditions():
+    """Create the configured renditions of existing audio files that lack them."""
+    ids = [row.id for row in db.session.query(AudioFile.id).order_by(AudioFile.id)]
+    created = 0
+    for audio_file_id in ids:
+        audio_file = AudioFile.query.get(audio_file_id)
+        created += len(create_renditions(audio_file))
+        db.session.commit()
+        db.session.expunge_all()
+    logger.info(f"Created {created} renditions for {len(ids)} audio files")
+    return created
+
+
+class _FirstAudioTimer:
+    """Stands in for a ProgressiveAudioWriter to time when the first audio could be played."""
+
+    def __init__(self):
+        self.first_audio_at = None
+
+    def append_frames(self, frames, pause_before=False):
+        if self.first_audio_at is None:
+            self.first_audio_at = time.perf_counter()
+
+    def abort(self):
+        pass
+
+
+def benchmark_tts(provider_name="fake", chars=20000):
+    """
+    Time the audio path of an email, from its script to stored audio, without the TTS cache.
+    
+    With the fake provider, which needs no API key, the run is deterministic and offline; its
+    latency and throughput are set by Config.FAKE_TTS_LATENCY and FAKE_TTS_THROUGHPUT.
+    
+    Args:
+        provider_name: Text-to-speech provider to use
+        chars: Approximate length of the generated email script, in characters
+    """
+    paragraphs = []
+    section = 0
+    while sum(len(paragraph) for paragraph in paragraphs) < chars:
+        section += 1
+        paragraphs.append(f"## Section {section}")
+        paragraphs.extend(
+            " ".join(f"This is sentence {sentence} of paragraph {paragraph} in section {section}." for sentence in range(1, 6))
+            for paragraph in range(1, 4)
+        )
+    script = "\n\n".join(paragraphs)
+
+    voice_generator = VoiceClipGenerator(provider=get_tts_provider(provider_name))
+    voice_generator.tts_cache = None  # Measure synthesis, not cache hits
+    timer = _FirstAudioTimer()
+
+    started = time.perf_counter()
+    audio_data, section_index = voice_generator.text_to_speech_indexed(script, content_type="email", writer=timer)
+    synthesized = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        FilesystemAudioStorage(directory).put(audio_data)
+    stored = time.perf_counter()
+
+    duration = section_index[-1]['end'] if section_index else 0
+    logger.info(f"{provider_name}: {len(script)} characters in {len(section_index)} sections, "
+                f"{len(audio_data)} bytes, {duration:.1f}s of audio")
+    logger.info(f"First audio after {timer.first_audio_at - started:.2f}s, synthesized in {synthesized - started:.2f}s, "
+                f"stored in {stored - synthesized:.3f}s with {Config.TTS_MAX_CONCURRENCY} concurrent requests "
+                f"({duration / (stored - started):.1f}x realtime)")
+    return {
+        'first_audio': timer.first_audio_at - started,
+        'total': stored - started,
+        'bytes': len(audio_data),
+        'duration': duration,
+    }
+
+
 if __name__ == "__main__":
     import sys
     from app import create_app
     
-    app = create_app()
+    app = create_app(start_async_processor=False)
     
     if len(sys.argv) < 2:
         print("Please provide a tool name and required arguments")
         print("Available tools:")
-        print("- regenerate_summary <summary_id>")
+        print("- regenerate_summary <summary_id> [--force]")
         print("- regenerate_audio <summary_id>")
         print("- create_mailbox <user_id>")
         print("- test_forwarder <user_id>")
         print("- test_email")
         print("- synthesize_summary <summary_id>")
+        print("- prompt_token_report [days]")
+        print("- dedup_report <user_id> [days]")
+        print("- migrate_audio_storage")
+        print("- gc_audio_storage [--delete]")
+        print("- create_audio_renditions")
+        print("- benchmark_tts [provider] [chars]")
         sys.exit(1)
     
     tool_name = sys.argv[1]
@@ -189,7 +375,7 @@ if __name__ == "__main__":
                 print("Please provide a summary_id")
                 sys.exit(1)
             summary_id = int(sys.argv[2])
-            re_generate_summary(summary_id)
+            re_generate_summary(summary_id, force="--force" in sys.argv[3:])
             
         elif tool_name == "regenerate_audio":
             if len(sys.argv) < 3:
@@ -222,13 +408,45 @@ if __name__ == "__main__":
             summary_id = int(sys.argv[2])
             eleven_labs_synthesize_summary(summary_id)
             
+        elif tool_name == "prompt_token_report":
+            days = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+            prompt_token_report(days)
+            
+        elif tool_name == "dedup_report":
+            if len(sys.argv) < 3:
+                print("Please provide a user_id")
+                sys.exit(1)
+            user_id = int(sys.argv[2])
+            days = int(sys.argv[3]) if len(sys.argv) > 3 else 7
+            dedup_report(user_id, days)
+            
+        elif tool_name == "migrate_audio_storage":
+            migrate_audio_storage()
+            
+        elif tool_name == "gc_audio_storage":
+            gc_audio_storage(dry_run="--delete" not in sys.argv[2:])
+            
+        elif tool_name == "create_audio_renditions":
+            create_audio_renditions()
+            
+        elif tool_name == "benchmark_tts":
+            provider_name = sys.argv[2] if len(sys.argv) > 2 else "fake"
+            chars = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+            benchmark_tts(provider_name, chars)
+            
         else:
             print(f"Unknown tool: {tool_name}")
             print("Available tools:")
-            print("- regenerate_summary <summary_id>")
+            print("- regenerate_summary <summary_id> [--force]")
             print("- regenerate_audio <summary_id>")
             print("- create_mailbox <user_id>")
             print("- test_forwarder <user_id>")
             print("- test_email")
             print("- synthesize_summary <summary_id>")
+            print("- prompt_token_report [days]")
+            print("- dedup_report <user_id> [days]")
+            print("- migrate_audio_storage")
+            print("- gc_audio_storage [--delete]")
+            print("- create_audio_renditions")
+            print("- benchmark_tts [provider] [chars]")
             sys.exit(1) 
\ No newline at end of file
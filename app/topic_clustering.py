@@ -0,0 +1,110 @@
+import re
+
+import numpy as np
+
+from config import Config
+
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'-]+")
+_STOP_WORDS = {
+    "a", "about", "after", "all", "also", "an", "and", "are", "as", "at", "be", "been", "but", "by",
+    "can", "for", "from", "has", "have", "how", "in", "into", "is", "it", "its", "more", "new", "not",
+    "of", "on", "or", "our", "over", "that", "the", "their", "this", "to", "up", "was", "were", "what",
+    "which", "while", "who", "will", "with", "you", "your",
+}
+
+
+def _terms(text: str) -> list[str]:
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in _STOP_WORDS]
+
+
+def tfidf_matrix(documents: list[str]) -> np.ndarray:
+    """TF-IDF vectors of the documents, one L2-normalized row per document."""
+    tokenized = [_terms(document) for document in documents]
+    vocabulary = {}
+    for terms in tokenized:
+        for term in terms:
+            vocabulary.setdefault(term, len(vocabulary))
+
+    counts = np.zeros((len(documents), max(len(vocabulary), 1)))
+    for row, terms in enumerate(tokenized):
+        for term in terms:
+            counts[row, vocabulary[term]] += 1
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    vectors = counts * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def cluster_vectors(vectors: np.ndarray, threshold: float, max_clusters: int) -> list[list[int]]:
+    """
+    Greedy agglomerative clustering on cosine similarity of cluster centroids.
+
+    The two most similar clusters are merged while their similarity is at least `threshold`,
+    or while there are more than `max_clusters` clusters. Clusters are returned in order of
+    their first member.
+    """
+    clusters = [[i] for i in range(len(vectors))]
+    centroids = vectors.copy()
+    while len(clusters) > 1:
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        normalized = centroids / norms
+        similarity = normalized @ normalized.T
+        np.fill_diagonal(similarity, -1)
+        i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+        if similarity[i, j] < threshold and len(clusters) <= max_clusters:
+            break
+        i, j = min(i, j), max(i, j)
+        clusters[i].extend(clusters.pop(j))
+        centroids[i] += centroids[j]
+        centroids = np.delete(centroids, j, axis=0)
+    return sorted((sorted(cluster) for cluster in clusters), key=lambda cluster: cluster[0])
+
+
+def cluster_topics(newsletters: list[dict], threshold: float = None, max_sections: int = None) -> list[list[dict]]:
+    """
+    Group the topics of the newsletters into thematic sections.
+
+    Topics are compared on the TF-IDF vectors of their header and summary.
+
+    Parameters:
+    - newsletters: newsletters in the `Email.to_newsletter()` format.
+    - threshold: minimum cosine similarity for two groups of topics to be merged (optional).
+    - max_sections: maximum number of sections to return (optional).
+
+    Returns:
+    - list[list[dict]]: one entry per section, holding newsletters in the same format that only
+      contain the topics of that section.
+    """
+    threshold = threshold if threshold is not None else Config.SECTION_SIMILARITY_THRESHOLD
+    max_sections = max_sections or Config.MAX_SYNTHESIS_SECTIONS
+
+    topics = [
+        (newsletter['name'], topic)
+        for newsletter in newsletters
+        for topic in newsletter['topics']
+    ]
+    if not topics:
+        return []
+
+    vectors = tfidf_matrix([f"{topic['header']} {topic['summary']}" for _, topic in topics])
+    clusters = cluster_vectors(vectors, threshold, max_sections)
+
+    sections = []
+    for cluster in clusters:
+        section = []
+        for index in cluster:
+            name, topic = topics[index]
+            if not section or section[-1]['name'] != name:
+                section.append({'name': name, 'topics': []})
+            section[-1]['topics'].append(topic)
+        sections.append(section)
+    return sections
+
+
+def count_topics(newsletters: list[dict]) -> int:
+    """Total number of topics across the newsletters."""
+    return sum(len(newsletter['topics']) for newsletter in newsletters)
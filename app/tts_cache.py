@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+from config import Config
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, which does not change how the text is spoken."""
+    return " ".join(text.split())
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized speech on the filesystem.
+
+    Each entry is the encoded audio of one segment, stored under the sha256 of
+    (provider, voice, model, normalized text). Reads refresh the entry's modification time,
+    and the least recently used entries are evicted once the cache grows past `max_bytes`.
+    Safe to use from several threads and processes: entries are written to a temporary file
+    and renamed into place.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        self.directory = directory or Config.TTS_CACHE_DIR
+        self.max_bytes = max_bytes or Config.TTS_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(provider: str, voice: str, model: str, text: str) -> str:
+        payload = json.dumps([provider, voice, model, normalize_text(text)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[os.DirEntry]:
+        entries = []
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                entries.extend(entry for entry in os.scandir(shard.path) if entry.name.endswith(".mp3"))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is under 90% of its budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        size = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for entry in entries:
+            if size <= target:
+                break
+            try:
+                entry_size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            size -= entry_size
+            evicted += 1
+        self._size = size
+        logging.info(f"Evicted {evicted} speech segments from the TTS cache, {size} bytes left")
+
+    def get_or_synthesize(self, provider: str, voice: str, model: str, text: str, synthesize) -> bytes:
+        """The cached audio of the segment, or `synthesize()`'s result, which is then cached."""
+        key = self.key(provider, voice, model, text)
+        data = self.get(key)
+        if data is not None:
+            return data
+        data = synthesize()
+        try:
+            self.put(key, data)
+        except OSError as e:
+            logging.warning(f"Could not cache speech segment {key}: {e}")
+        return data
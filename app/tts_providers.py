@@ -0,0 +1,157 @@
+from abc import ABC, abstractmethod
+import io
+import logging
+import math
+import time
+
+from elevenlabs import ElevenLabs, VoiceSettings
+from elevenlabs.core.api_error import ApiError
+import httpx
+from openai import OpenAI
+
+from app import mp3_frames
+from app.model_router import TRANSIENT_ERRORS
+from config import Config
+
+
+class TTSProvider(ABC):
+    """
+    A text-to-speech backend that streams encoded MP3 audio as the provider produces it.
+
+    `name`, `voice` and `model` identify the audio it makes, e.g. as TTS cache keys, and
+    `max_chars` is the longest text accepted in one request.
+    """
+
+    name = None
+    max_chars = 4096
+
+    def __init__(self, voice: str = None, model: str = None):
+        self.voice = voice
+        self.model = model
+
+    @abstractmethod
+    def stream(self, text: str):
+        """Yield the MP3 bytes of `text` as they arrive."""
+
+    def is_transient(self, error: Exception) -> bool:
+        """Whether the error is worth retrying, e.g. a timeout or rate limit."""
+        return isinstance(error, TRANSIENT_ERRORS)
+
+    def synthesize(self, text: str, on_data=None) -> bytes:
+        """
+        The MP3 audio of `text`, retrying transient errors with exponential backoff.
+
+        Args:
+            text: Text to speak
+            on_data: Called with each piece of audio as it arrives, e.g. to write it to a
+                progressive stream. Pieces already handed over cannot be taken back, so an
+                error after the first one is not retried.
+        """
+        for attempt in range(Config.TTS_MAX_RETRIES + 1):
+            buffer = io.BytesIO()
+            try:
+                for chunk in self.stream(text):
+                    buffer.write(chunk)
+                    if on_data:
+                        on_data(chunk)
+                return buffer.getvalue()
+            except Exception as e:
+                if not self.is_transient(e) or attempt == Config.TTS_MAX_RETRIES or (on_data and buffer.tell()):
+                    raise
+                delay = Config.TTS_RETRY_BACKOFF * 2 ** attempt
+                logging.warning(f"Speech segment failed ({type(e).__name__}: {e}), retrying in {delay}s")
+                time.sleep(delay)
+
+
+class OpenAITTSProvider(TTSProvider):
+    name = "openai"
+    max_chars = Config.OPENAI_TTS_MAX_CHARS
+
+    def __init__(self, voice: str = None, model: str = None):
+        super().__init__(voice or Config.OPENAI_TTS_VOICE, model or Config.OPENAI_TTS_MODEL)
+        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+
+    def stream(self, text: str):
+        with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=self.voice,
+            input=text,
+            response_format="mp3"
+        ) as response:
+            yield from response.iter_bytes(chunk_size=Config.TTS_STREAM_CHUNK_SIZE)
+
+
+class ElevenLabsTTSProvider(TTSProvider):
+    name = "elevenlabs"
+    max_chars = Config.ELEVEN_LABS_TTS_MAX_CHARS
+
+    def __init__(self, voice: str = None, model: str = None):
+        super().__init__(voice or Config.ELEVEN_LABS_VOICE_ID, model or "eleven_turbo_v2")
+        self.client = ElevenLabs(api_key=Config.ELEVEN_LABS_API_KEY)
+
+    def is_transient(self, error: Exception) -> bool:
+        # Rate limits and server errors come as API errors with their status code
+        if isinstance(error, ApiError):
+            return error.status_code == 429 or (error.status_code or 0) >= 500
+        return isinstance(error, httpx.TransportError)
+
+    def stream(self, text: str):
+        yield from self.client.text_to_speech.convert(
+            voice_id=self.voice,
+            model_id=self.model,
+            text=text,
+            voice_settings=VoiceSettings(
+                stability=0.3,
+                similarity_boost=0.3
+            )
+        )
+
+
+class FakeTTSProvider(TTSProvider):
+    """
+    Deterministic offline provider, to run and benchmark the audio path without API calls.
+
+    The audio is silence lasting as long as the text would take to read at `chars_per_second`,
+    in the MPEG-2 24 kHz mono format of OpenAI speech. The first bytes come after `latency`
+    seconds and the rest at `throughput` bytes per second (0 for no limit).
+    """
+
+    name = "fake"
+    # MPEG-2 Layer III, 64 kbps, 24 kHz, mono, no CRC
+    _HEADER = bytes([0xFF, 0xF3, 0x84, 0xC4])
+
+    def __init__(self, voice: str = "silence", model: str = "fake", latency: float = None,
+                 throughput: int = None, chars_per_second: float = None, max_chars: int = None):
+        super().__init__(voice, model)
+        self.latency = Config.FAKE_TTS_LATENCY if latency is None else latency
+        self.throughput = Config.FAKE_TTS_THROUGHPUT if throughput is None else throughput
+        self.chars_per_second = chars_per_second or Config.FAKE_TTS_CHARS_PER_SECOND
+        self.max_chars = max_chars or Config.OPENAI_TTS_MAX_CHARS
+
+    def audio(self, text: str) -> bytes:
+        header = mp3_frames.FrameHeader(self._HEADER)
+        seconds = len(text) / self.chars_per_second
+        frames = max(1, math.ceil(seconds * header.sample_rate / header.samples))
+        return mp3_frames.silent_frame(header) * frames
+
+    def stream(self, text: str):
+        data = self.audio(text)
+        time.sleep(self.latency)
+        chunk_size = Config.TTS_STREAM_CHUNK_SIZE
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset:offset + chunk_size]
+            if self.throughput:
+                time.sleep(len(chunk) / self.throughput)
+            yield chunk
+
+
+_PROVIDERS = {
+    'openai': OpenAITTSProvider,
+    'elevenlabs': ElevenLabsTTSProvider,
+    'fake': FakeTTSProvider,
+}
+
+
+def get_tts_provider(name: str = None) -> TTSProvider:
+    """The provider named, by default the one selected by `Config.TTS_PROVIDER`."""
+    return _PROVIDERS[name or Config.TTS_PROVIDER]()
@@ -1,130 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import os
+import logging
 from pathlib import Path
-import uuid
-from elevenlabs import ElevenLabs, VoiceSettings
-from openai import OpenAI
+from app import mp3_frames, speech_formatter
+from app.audio_renditions import store_audio
+from app.audio_stream import OrderedSegmentRelay, ProgressiveAudioWriter, progressive_audio
 from app.summary_generator import SummaryGenerator
+from app.text_segmenter import pack_sections
+from app.tts_cache import TTSCache
+from app.tts_providers import TTSProvider, get_tts_provider
 from config import Config
 from app.models import Email, Summary, db, AudioFile
 from pydub import AudioSegment
 import io
-import tempfile
 from flask import current_app
 class VoiceClipGenerator:
-    def __init__(self):
-        self.client = ElevenLabs(
-            api_key=Config.ELEVEN_LABS_API_KEY,
-        )
-        self.client_openai = OpenAI(api_key=Config.OPENAI_API_KEY)
+    def __init__(self, provider: TTSProvider = None):
+        """
+        Args:
+            provider: Text-to-speech backend, by default the one selected by Config.TTS_PROVIDER
+        """
+        self.provider = provider or get_tts_provider()
+        self.tts_cache = None
+        if Config.TTS_CACHE_ENABLED:
+            try:
+                self.tts_cache = TTSCache()
+            except OSError as e:
+                logging.warning(f"TTS cache disabled: {e}")
         
     def _generate_summary_list(self, summary: Summary) -> list[str]:
-        """Generate a list of text segments from a summary.
+        """Generate a list of text sections from a summary.
         
         Returns:
-            list[str]: A list where each item is either a key point or a topic with its content
+            list[str]: A list where each item is either the title, the key points, or a topic with its content
         """
         segments = [summary.title]
         
         if Config.INCLUDE_KEY_POINTS == "true":
             if summary.key_points:
-                segments.append("Key Points:")
-                for point in summary.key_points:
-                    segments.append(f"• {point['text']}")
+                segments.append("Key Points:\n\n" + "\n\n".join(f"• {point['text']}" for point in summary.key_points))
         
         if summary.sections:
             for section in summary.sections:
-                segments.append(f"{section['header']}:")
-                segments.append(section['content'])
+                segments.append(f"{section['header']}:\n\n{section['content']}")
         
         return segments
     
     def eleven_labs_text_to_speech(self, summary: Summary) -> bytes:
-        text = summary.title + "\n\n --- --- --- --- \n\n" 
-        text += "Key Points: \n--- --- --- \n"
-        for point in summary.key_points:
-            text += f"{point['text']}\n --- --- \n"
-        
-        text += " --- --- Topics: --- --- \n\n"
+        sections = [summary.title]
+        sections.append("Key Points:\n\n" + "\n\n".join(point['text'] for point in summary.key_points))
+        sections.append("Topics:")
         for section in summary.sections:
-            text += f"{section['header']}:\n{section['content']} --- --- \n\n"
+            sections.append(f"{section['header']}:\n\n{section['content']}")
 
-        data = self.client.text_to_speech.convert(
-                voice_id=Config.ELEVEN_LABS_VOICE_ID,
-                model_id="eleven_turbo_v2",
-                text=text,
-                voice_settings=VoiceSettings(
-                    stability=0.3,
-                    similarity_boost=0.3
-                )   
-            )
+        provider = self.provider if self.provider.name == "elevenlabs" else get_tts_provider("elevenlabs")
+        audio_data, _ = self._synthesize_sections(sections, lambda text, on_data=None: self._speech_segment(text, provider, on_data), provider.max_chars)
+        return audio_data
 
-        # Save the audio file
-        buffer = io.BytesIO()
-        for chunk in data:
-            buffer.write(chunk)
-        return buffer.getvalue()
-    
+    def _synthesize_sections(self, sections: list[str], synthesize, max_chars: int, writer: ProgressiveAudioWriter = None) -> tuple[bytes, list[dict]]:
+        """
+        Synthesize text sections with as few requests as possible and join the audio.
+        
+        Each section is packed at paragraph and sentence boundaries into chunks of at most
+        `max_chars` characters, the chunks are synthesized concurrently with
+        `synthesize(text, on_data=...)`, and pauses are inserted between sections only.
+        
+        With a `writer`, the audio is also appended to its progressive stream in order: the
+        earliest unfinished chunk as its bytes arrive from the provider, later chunks once all the
+        chunks before them are synthesized.
+        
+        Returns the audio and its section index: for each section, its title and its start and end
+        in seconds and in bytes (bytes are None when the audio had to be re-encoded). A section
+        ends where the next one starts, so it includes the pause that follows it.
+        """
+        return self._synthesize_section_batches([sections], synthesize, max_chars, writer)
+
+    def _synthesize_section_batches(self, batches, synthesize, max_chars: int, writer: ProgressiveAudioWriter = None) -> tuple[bytes, list[dict]]:
+        """
+        Like `_synthesize_sections`, for sections that arrive in batches from an iterable, e.g. as
+        their script is written. The chunks of a batch are submitted for synthesis as soon as the
+        batch arrives, while the next one is being produced.
+        """
+        futures = []
+        # Index of the first chunk of every section but the first
+        pause_before = set()
+        # Title and chunk count of every section with audio
+        section_chunks = []
+        relay = OrderedSegmentRelay(writer, pause_before) if writer else None
+
+        def synthesize_chunk(index: int, text: str) -> bytes:
+            if not relay:
+                return synthesize(text)
+            segment = synthesize(text, on_data=lambda data: relay.feed(index, data))
+            relay.finish(index, segment)
+            return segment
+
+        # Synthesize chunks concurrently
+        with ThreadPoolExecutor(max_workers=Config.TTS_MAX_CONCURRENCY) as executor:
+            for sections in batches:
+                # pack_sections drops empty sections
+                sections_with_audio = [section for section in sections if section.strip()]
+                for section_text, chunks in zip(sections_with_audio, pack_sections(sections, max_chars)):
+                    if futures:
+                        pause_before.add(len(futures))
+                    section_chunks.append((section_text.strip().splitlines()[0].strip().rstrip(':')[:100], len(chunks)))
+                    for chunk in chunks:
+                        futures.append(executor.submit(synthesize_chunk, len(futures), chunk))
+            audio_segments = [future.result() for future in futures]
 
+        audio_data, starts = self._coalesce_audio_segments_indexed(audio_segments, pause_before=pause_before)
 
-    def _coalesce_audio_segments(self, audio_segments: list, pause_duration: int = 1000) -> bytes:
+        section_index = []
+        first_chunk = 0
+        for title, chunk_count in section_chunks:
+            start, end = starts[first_chunk], starts[first_chunk + chunk_count]
+            section_index.append({
+                'title': title,
+                'start': start[1],
+                'end': end[1],
+                'start_byte': start[0],
+                'end_byte': end[0],
+            })
+            first_chunk += chunk_count
+        return audio_data, section_index
+
+    def _coalesce_audio_segments(self, audio_segments: list[bytes], pause_duration: int = 1000, pause_before: set[int] = None) -> bytes:
         """
-        Combines audio segments with pauses between them.
+        Combines MP3 audio segments with pauses between them.
         Returns the combined audio as bytes.
+        
+        `pause_before` holds the indexes of the segments preceded by a pause; by default there is
+        a pause between every two segments.
         """
+        return self._coalesce_audio_segments_indexed(audio_segments, pause_duration, pause_before)[0]
+
+    def _coalesce_audio_segments_indexed(self, audio_segments: list[bytes], pause_duration: int = 1000, pause_before: set[int] = None) -> tuple[bytes, list[tuple]]:
+        """
+        Like `_coalesce_audio_segments`, also returning the (byte offset, seconds) where each segment
+        starts, followed by the end of the audio.
+        
+        Frames are joined directly when all segments share a format; otherwise the segments
+        are decoded and re-encoded with pydub, and byte offsets are unknown (None).
+        """
+        try:
+            return mp3_frames.concatenate_indexed(audio_segments, pause_ms=pause_duration, pause_before=pause_before)
+        except mp3_frames.Mp3FormatError as e:
+            logging.warning(f"Cannot join audio frames directly ({e}), re-encoding with pydub")
+
         # Create a silent audio segment for pauses
         silence = AudioSegment.silent(duration=pause_duration)
         
         # Initialize an empty audio segment
         final_audio = AudioSegment.empty()
+        starts = []
         
         for i, segment in enumerate(audio_segments):
-            current_app.logger.info(f"Processing segment {segment}")
-            audio_segment = AudioSegment.from_mp3(segment)
+            audio_segment = AudioSegment.from_mp3(io.BytesIO(segment))
             
             # Add the audio segment
+            starts.append((None, len(final_audio) / 1000))
             final_audio += audio_segment
             
-            # Add silence after each segment (except the last one)
-            if i < len(audio_segments) - 1:
+            # Add silence after each segment followed by a pause
+            if i < len(audio_segments) - 1 and (pause_before is None or i + 1 in pause_before):
                 final_audio += silence
         
+        starts.append((None, len(final_audio) / 1000))
+        
         # Export to bytes instead of file
         buffer = io.BytesIO()
         final_audio.export(buffer, format="mp3")
-        return buffer.getvalue()
+        return buffer.getvalue(), starts
     
    
 
     def _generate_email_segments(self, email_text: str) -> list[str]:
-        """Generate a list of text segments from an email.
+        """Generate a list of text sections from an email.
         Similar to _generate_summary_list but for email content.
         
+        Sections start at markdown headings and horizontal rules; paragraphs stay
+        together in their section.
+        
         Args:
             email_text: The email content in markdown format
             
         Returns:
-            list[str]: A list of text segments suitable for audio generation
+            list[str]: A list of text sections suitable for audio generation
         """
-        # Split by double newlines to get paragraphs
         segments = []
-        paragraphs = email_text.split('\n\n')
-        
-        for paragraph in paragraphs:
-            # Skip empty paragraphs
-            if not paragraph.strip():
-                continue
-                
-            # Clean up the paragraph
-            cleaned = paragraph.strip()
-            if cleaned:
-                segments.append(cleaned)
+        current = []
+        for line in email_text.splitlines():
+            stripped = line.strip()
+            is_rule = bool(stripped) and set(stripped) <= set("-*_") and len(stripped) >= 3
+            if stripped.startswith("#") or is_rule:
+                if current:
+                    segments.append("\n".join(current).strip())
+                # Keep the heading as its own paragraph
+                current = [] if is_rule else [stripped.lstrip("#").strip(), ""]
+            else:
+                current.append(line)
+        if current:
+            segments.append("\n".join(current).strip())
                 
-        return segments
+        return [segment for segment in segments if segment]
 
-    def openai_text_to_speech(self, content, content_type='summary') -> bytes:
-        """Generate audio file from text using OpenAI's text-to-speech.
+    def _cached_speech(self, provider: str, voice: str, model: str, text: str, synthesize) -> bytes:
+        """Audio of `text` from the TTS cache, synthesized with `synthesize()` on a miss."""
+        if not self.tts_cache:
+            return synthesize()
+        return self.tts_cache.get_or_synthesize(provider, voice, model, text, synthesize)
+
+    def _speech_segment(self, text: str, provider: TTSProvider = None, on_data=None) -> bytes:
+        """Synthesize one segment to MP3 bytes with the provider, by default the generator's.
+        Segments already in the TTS cache are not synthesized again; others are also passed to
+        `on_data` piece by piece as they arrive.
+        Runs on worker threads, so it must not rely on the Flask app context.
+        """
+        provider = provider or self.provider
+        return self._cached_speech(provider.name, provider.voice, provider.model, text, lambda: provider.synthesize(text, on_data))
+
+    def text_to_speech(self, content, content_type='summary', writer: ProgressiveAudioWriter = None) -> bytes:
+        """Generate audio file from text with the text-to-speech provider.
         Returns the audio data as bytes.
+        Segments are also written to `writer` for progressive playback, when given.
+        """
+        audio_data, _ = self.text_to_speech_indexed(content, content_type, writer)
+        return audio_data
+
+    def text_to_speech_indexed(self, content, content_type='summary', writer: ProgressiveAudioWriter = None) -> tuple[bytes, list[dict]]:
+        """Like `text_to_speech`, also returning the section index of the audio
+        (see `_synthesize_sections`).
         """
         # Generate segments based on content type
         if content_type == 'summary':
@@ -132,37 +237,30 @@ class VoiceClipGenerator:
         else:  # email, or other text
             segments = self._generate_email_segments(content)
             
-        audio_segments = []
-        temp_dir = tempfile.mkdtemp()
+        return self._synthesize_sections(segments, self._speech_segment, self.provider.max_chars, writer)
+
+    def script_to_speech_indexed(self, content: str, writer: ProgressiveAudioWriter = None, content_type: str = 'email') -> tuple[str, bytes, list[dict]]:
+        """
+        Convert content to an audio script and synthesize it, overlapping the two: each chunk of
+        the script is sent to text-to-speech as soon as it is written. Chunks the LLM is too slow
+        to convert are formatted by the rule-based speech formatter instead. `content_type`,
+        'email' or 'summary', selects the conversion prompt.
         
-        try:
-            for segment in segments:
-                response = self.client_openai.audio.speech.create(
-                    model="tts-1",
-                    voice="alloy", 
-                    input=segment
-                )
-                tmp_file = os.path.join(temp_dir, f"tmp_{uuid.uuid4()}.mp3")
-                response.write_to_file(tmp_file)
-                audio_segments.append(tmp_file)
+        Returns:
+            str: the audio script
+            bytes: the audio
+            list[dict]: the section index of the audio (see `_synthesize_sections`)
+        """
+        summary_generator = SummaryGenerator()
+        script_chunks = []
 
-            # Use the new coalesce function to get bytes
-            audio_data = self._coalesce_audio_segments(audio_segments)
-            
-            return audio_data
-            
-        finally:
-            # Clean up temporary files and directory
-            for tmp_file in audio_segments:
-                try:
-                    if os.path.exists(tmp_file):
-                        os.remove(tmp_file)
-                except OSError as e:
-                    current_app.logger.warning(f"Error removing temporary file {tmp_file}: {e}")
-            try:
-                os.rmdir(temp_dir)
-            except OSError as e:
-                current_app.logger.warning(f"Error removing temporary directory {temp_dir}: {e}")
+        def batches():
+            for script_chunk in summary_generator.convert_to_audio_format_chunks(content, fallback=speech_formatter.format_markdown, content_type=content_type):
+                script_chunks.append(script_chunk)
+                yield self._generate_email_segments(script_chunk)
+
+        audio_data, section_index = self._synthesize_section_batches(batches(), self._speech_segment, self.provider.max_chars, writer)
+        return "\n\n".join(script_chunks), audio_data, section_index
 
     def generate_voice_clip(self, summary_id=None, email_id=None):
         """Generate a voice clip for a given summary or email."""
@@ -184,10 +282,10 @@ class VoiceClipGenerator:
 
         try:
             # Generate audio data
-            if Config.VOICE_GENERATOR == "elevenlabs":
+            if self.provider.name == "elevenlabs" and content_type == 'summary':
                 audio_data = self.eleven_labs_text_to_speech(content)
             else:
-                audio_data = self.openai_text_to_speech(content, content_type)
+                audio_data = self.text_to_speech(content, content_type)
             
             # Create filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -196,10 +294,10 @@ class VoiceClipGenerator:
             # Create AudioFile record
             audio_file = AudioFile(
                 filename=filename,
-                data=audio_data,
                 summary_id=summary_id,
                 email_id=email_id
             )
+            store_audio(audio_file, audio_data)
             db.session.add(audio_file)
             
             # Update content record
@@ -219,113 +317,117 @@ class VoiceClipGenerator:
         
 
     def content_to_audio(self, content, content_type) -> bool:
-        summary_generator = SummaryGenerator()
-        audio_text = summary_generator.convert_to_audio_format(content)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        voice_data = self.openai_text_to_speech(audio_text, content_type)
+        audio_text, voice_data, _ = self.script_to_speech_indexed(content, content_type=content_type)
         return audio_text, voice_data
 
 
 
-    def email_to_audio(self, email) -> bool:
+    def email_to_audio(self, email, stream=False, script_mode=None) -> bool:
+        """
+        Converts an email to audio format and saves it to the database.
+        
+        With `stream`, the audio is also written for progressive playback while it is synthesized.
+        `script_mode` selects how the audio script is written, 'llm' or 'rules', by default
+        Config.AUDIO_SCRIPT_MODE.
+        """
         current_app.logger.info(f"Processing email {email.id} from {email.name}")
             
-        # Convert email content to audio-friendly format
-        current_app.logger.info(f"Converting email {email.id} content to audio format")
-        summary_generator = SummaryGenerator()
-        audio_text = summary_generator.convert_to_audio_format(email.to_md())
+        with progressive_audio('email', email.id, enabled=stream) as writer:
+            if (script_mode or Config.AUDIO_SCRIPT_MODE) == 'rules':
+                current_app.logger.info(f"Formatting email {email.id} content with rules and generating its audio")
+                audio_text = speech_formatter.format_email(email)
+                voice_data, section_index = self.text_to_speech_indexed(audio_text, content_type="email", writer=writer)
+            else:
+                # Convert email content to audio-friendly format, synthesizing each part as it is converted
+                current_app.logger.info(f"Converting email {email.id} content to audio format and generating its audio")
+                audio_text, voice_data, section_index = self.script_to_speech_indexed(email.to_md(), writer=writer)
         
-        # Save audio text to email object
-        email.audio_text = audio_text
-        db.session.commit()
-        current_app.logger.info(f"Saved audio text for email {email.id}")
+            # Save audio text to email object
+            email.audio_text = audio_text
+            db.session.commit()
+            current_app.logger.info(f"Saved audio text for email {email.id}")
 
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        audio_filename = f"newsletter_{email.id}_{timestamp}.mp3"
-        #audio_path = os.path.join(app.config['AUDIO_DIR'], audio_filename)
-        current_app.logger.info(f"Generated audio filename: {audio_filename}")
-        
-        # Generate audio file
-        current_app.logger.info(f"Generating audio file for email {email.id}")
-        voice_data = self.openai_text_to_speech( audio_text, content_type="email")
+            # Generate unique filename
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            audio_filename = f"newsletter_{email.id}_{timestamp}.mp3"
+            #audio_path = os.path.join(app.config['AUDIO_DIR'], audio_filename)
+            current_app.logger.info(f"Generated audio filename: {audio_filename}")
         
         
-        if voice_data:
-            # Update email record
-            current_app.logger.info(f"Successfully generated audio for email {email.id}, updating database record")
-            email.has_audio = True
-            # Create or update AudioFile record
-            audio_file = AudioFile.query.filter_by(email_id=email.id).first()
-            if audio_file:
-                audio_file.filename = audio_filename
-                audio_file.data = voice_data
+            if voice_data:
+                # Update email record
+                current_app.logger.info(f"Successfully generated audio for email {email.id}, updating database record")
+                email.has_audio = True
+                # Create or update AudioFile record
+                audio_file = AudioFile.query.filter_by(email_id=email.id).first()
+                if audio_file:
+                    audio_file.filename = audio_filename
+                else:
+                    audio_file = AudioFile(
+                        filename=audio_filename,
+                        email_id=email.id
+                    )
+                    db.session.add(audio_file)
+                store_audio(audio_file, voice_data, section_index)
+                db.session.commit()
+                current_app.logger.info(f"Database record updated for email {email.id}")
+                return True
             else:
-                audio_file = AudioFile(
-                    filename=audio_filename,
-                    data=voice_data,
-                    email_id=email.id
-                )
-                db.session.add(audio_file)
-            db.session.commit()
-            current_app.logger.info(f"Database record updated for email {email.id}")
-            return True
-        else:
-            current_app.logger.info(f"Failed to generate audio for email {email.id}")
-            return False
+                current_app.logger.info(f"Failed to generate audio for email {email.id}")
+                return False
 
-    def summary_to_audio(self, summary) -> bool:
+    def summary_to_audio(self, summary, stream=False, script_mode=None) -> bool:
         """
         Converts a summary to audio format and saves it to the database.
         
         Args:
             summary: Summary object to convert to audio
+            stream: Also write the audio for progressive playback while it is synthesized
+            script_mode: 'llm' or 'rules' to write the audio script, by default Config.AUDIO_SCRIPT_MODE
             
         Returns:
             bool: True if successful, False otherwise
         """
         current_app.logger.info(f"Processing summary {summary.id}")
         summary_text = summary.to_text()
-        # Convert summary content to audio-friendly format
-        current_app.logger.info(f"Converting summary {summary.id} content to audio format")
-        summary_generator = SummaryGenerator()
-        audio_text = summary_generator.convert_to_audio_format(summary_text)
+        with progressive_audio('summary', summary.id, enabled=stream) as writer:
+            if (script_mode or Config.AUDIO_SCRIPT_MODE) == 'rules':
+                current_app.logger.info(f"Formatting summary {summary.id} content with rules and generating its audio")
+                audio_text = speech_formatter.format_summary(summary)
+                voice_data, section_index = self.text_to_speech_indexed(audio_text, content_type="read text", writer=writer)
+            else:
+                # Convert summary content to audio-friendly format, synthesizing each part as it is converted
+                current_app.logger.info(f"Converting summary {summary.id} content to audio format and generating its audio")
+                audio_text, voice_data, section_index = self.script_to_speech_indexed(summary_text, writer=writer, content_type='summary')
         
-        # Save audio text to summary object
-        summary.content = audio_text
-        db.session.commit()
-        current_app.logger.info(f"Saved audio text for summary {summary.id}")
+            # Save audio text to summary object
+            summary.content = audio_text
+            db.session.commit()
+            current_app.logger.info(f"Saved audio text for summary {summary.id}")
 
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        audio_filename = f"summary_{summary.id}_{timestamp}.mp3"
-        
-        
-        # Generate audio file
-        current_app.logger.info(f"Generating audio file for summary {summary.id}")
-        voice_data = self.openai_text_to_speech(audio_text, content_type="read text")
+            # Generate unique filename
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            audio_filename = f"summary_{summary.id}_{timestamp}.mp3"
         
-        if voice_data:
-            # Update summary record
-            current_app.logger.info(f"Successfully generated audio for summary {summary.id}, updating database record")
-            summary.has_audio = True
+            if voice_data:
+                # Update summary record
+                current_app.logger.info(f"Successfully generated audio for summary {summary.id}, updating database record")
+                summary.has_audio = True
             
-            # Create or update AudioFile record
-            audio_file = AudioFile.query.filter_by(summary_id=summary.id).first()
-            if audio_file:
-                audio_file.filename = audio_filename
-                audio_file.data = voice_data
+                # Create or update AudioFile record
+                audio_file = AudioFile.query.filter_by(summary_id=summary.id).first()
+                if audio_file:
+                    audio_file.filename = audio_filename
+                else:
+                    audio_file = AudioFile(
+                        filename=audio_filename,
+                        summary_id=summary.id
+                    )
+                    db.session.add(audio_file)
+                store_audio(audio_file, voice_data, section_index)
+                db.session.commit()
+                current_app.logger.info(f"Database record updated for summary {summary.id}")
+                return True
             else:
-                audio_file = AudioFile(
-                    filename=audio_filename,
-                    data=voice_data,
-                    summary_id=summary.id
-                )
-                db.session.add(audio_file)
-            db.session.commit()
-            current_app.logger.info(f"Database record updated for summary {summary.id}")
-            return True
-        else:
-            current_app.logger.info(f"Failed to generate audio for summary {summary.id}")
-            return False
\ No newline at end of file
+                current_app.logger.info(f"Failed to generate audio for summary {summary.id}")
+                return False
@@ -31,11 +31,126 @@ class Config:
     
     ELEVEN_LABS_API_KEY = os.environ.get('ELEVEN_LABS_API_KEY') or None  # Replace with your actual API key
     ELEVEN_LABS_VOICE_ID = "nPczCjzI2devNBz1zQrb"  # Replace with your preferred voice ID
-    VOICE_GENERATOR = "openai"
+    OPENAI_TTS_MODEL = "tts-1"
+    OPENAI_TTS_VOICE = "alloy"
+    # Speech requests are packed up to the provider's input limit, in characters
+    OPENAI_TTS_MAX_CHARS = 4096
+    ELEVEN_LABS_TTS_MAX_CHARS = 5000
+    # Text-to-speech backend: openai, elevenlabs, or fake for offline runs and benchmarks
+    TTS_PROVIDER = os.environ.get('TTS_PROVIDER', 'openai')
+    TTS_STREAM_CHUNK_SIZE = 16 * 1024  # Bytes read at a time from streaming providers
+    FAKE_TTS_LATENCY = float(os.environ.get('FAKE_TTS_LATENCY', 0.5))  # Seconds before the first byte
+    FAKE_TTS_THROUGHPUT = int(os.environ.get('FAKE_TTS_THROUGHPUT', 64 * 1024))  # Bytes per second, 0 for no limit
+    FAKE_TTS_CHARS_PER_SECOND = 15  # Speaking rate of the fake audio
     INCLUDE_KEY_POINTS = "false"
     
     # For generating absolute URLs
     SERVER_NAME = os.environ.get('SERVER_NAME', 'localhost:5000')
     AUDIO_DIR = os.environ.get('AUDIO_DIR', '/Users/jac/Dev/src/hermes/app/static/audio')
     MAX_NEWSLETTERS_PER_DAY = 5  # Adjust as needed
+    # Private application data, outside of the static folder Flask serves publicly;
+    # defaults to the app's instance folder
+    DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance'))
+    # Where generated audio is stored; AudioFile rows only hold its key, size and digest
+    AUDIO_STORAGE_BACKEND = os.environ.get('AUDIO_STORAGE_BACKEND', 'filesystem')
+    AUDIO_STORAGE_DIR = os.environ.get('AUDIO_STORAGE_DIR', os.path.join(DATA_DIR, 'audio_store'))
+    # Alternative encodings created with every audio file, selected with ?rendition=<name>
+    AUDIO_RENDITIONS = {
+        'low': {'format': 'mp3', 'bitrate': '32k', 'channels': 1, 'sample_rate': 22050, 'mimetype': 'audio/mpeg'},
+    }
+    SAVE_DATA_RENDITION = 'low'  # Served to clients sending `Save-Data: on`
 
+    # Near-duplicate story elimination before synthesis
+    DEDUPLICATE_STORIES = os.environ.get('DEDUPLICATE_STORIES', 'true') == 'true'
+    STORY_DUPLICATE_THRESHOLD = 0.4  # Estimated Jaccard similarity of word shingles
+    STORY_SHINGLE_SIZE = 2  # Words per shingle
+    STORY_MINHASH_PERMUTATIONS = 128
+
+    # Per-section synthesis for large digests
+    PARALLEL_SYNTHESIS_MIN_TOPICS = 12  # Digests with fewer topics use a single completion
+    SECTION_SIMILARITY_THRESHOLD = 0.2  # Cosine similarity of TF-IDF vectors to merge topics
+    MAX_SYNTHESIS_SECTIONS = 8
+    SYNTHESIS_MAX_WORKERS = 8
+
+
+    # LLM routing: each call site runs on a tier, each tier has a primary model,
+    # a fallback used when the primary times out or errors, and a timeout in seconds
+    MODEL_TIERS = {
+        'quality': {'model': 'gpt-4o', 'fallback': 'gpt-4o-mini', 'timeout': 120},
+        'fast': {'model': 'gpt-4o-mini', 'fallback': 'gpt-4o', 'timeout': 60},
+        'interactive': {'model': 'gpt-4o-mini', 'fallback': 'gpt-4o', 'timeout': 20},
+    }
+    MODEL_ROUTES = {
+        'extraction': 'fast',
+        'sender_detection': 'fast',
+        'newsletter_name': 'fast',
+        'audio_script': 'fast',
+        'synthesis': 'quality',
+        'synthesis_section': 'quality',
+        'synthesis_overview': 'fast',
+        'chat': 'interactive',
+    }
+    DEFAULT_MODEL_TIER = 'quality'
+
+    # Async request queue: worker threads per process (0 to not process requests in this process)
+    ASYNC_WORKERS = int(os.environ.get('ASYNC_WORKERS', 2))
+    # Enqueuers NOTIFY this Postgres channel; idle workers wait for it, and check the queue every
+    # ASYNC_SAFETY_POLL_INTERVAL seconds in case a notification is lost
+    ASYNC_NOTIFY_CHANNEL = 'async_requests'
+    ASYNC_SAFETY_POLL_INTERVAL = 300
+    ASYNC_LISTEN_RETRY_DELAY = 5  # Seconds before listening again after the connection is lost
+    ASYNC_POLL_INTERVAL = 10  # Seconds between checks of the queue on databases without LISTEN/NOTIFY
+    # A claimed request is leased to its worker for ASYNC_LEASE_SECONDS, renewed every
+    # ASYNC_HEARTBEAT_INTERVAL seconds while it runs. Workers requeue requests whose lease expired
+    # every ASYNC_REAP_INTERVAL seconds, and fail them after ASYNC_MAX_ATTEMPTS claims
+    ASYNC_LEASE_SECONDS = int(os.environ.get('ASYNC_LEASE_SECONDS', 120))
+    ASYNC_HEARTBEAT_INTERVAL = 30
+    ASYNC_REAP_INTERVAL = 60
+    ASYNC_MAX_ATTEMPTS = int(os.environ.get('ASYNC_MAX_ATTEMPTS', 3))
+    # Workers take interactive requests before batch work, except every ASYNC_LOW_PRIORITY_EVERY-th
+    # claim, which takes the oldest batch request: batch work keeps at least that share of claims
+    ASYNC_LOW_PRIORITY_EVERY = int(os.environ.get('ASYNC_LOW_PRIORITY_EVERY', 5))
+    # /generate-summary/stream relays the progress of the summary request every
+    # SUMMARY_STREAM_POLL_INTERVAL seconds, for SUMMARY_STREAM_MAX_DURATION seconds at most
+    SUMMARY_STREAM_POLL_INTERVAL = 1
+    SUMMARY_STREAM_MAX_DURATION = 900
+
+    # Long content is converted to an audio script in chunks split at section boundaries
+    AUDIO_SCRIPT_CHUNK_CHARS = 4000
+    AUDIO_SCRIPT_MAX_WORKERS = 4
+    # 'llm' writes audio scripts with a completion, 'rules' with the rule-based speech formatter
+    AUDIO_SCRIPT_MODE = os.environ.get('AUDIO_SCRIPT_MODE', 'llm')
+    # Seconds to wait for the LLM before formatting the remaining chunks with rules, 0 to always wait
+    AUDIO_SCRIPT_FALLBACK_TIMEOUT = int(os.environ.get('AUDIO_SCRIPT_FALLBACK_TIMEOUT', 30))
+
+    # Email audio is pre-rendered only for newsletters the user is likely to listen to
+    AUDIO_DEMAND_HISTORY_DAYS = 30
+    AUDIO_DEMAND_READ_WEIGHT = 0.3  # An email read but not listened to counts as this much of a listen
+    AUDIO_DEMAND_PRIOR_LISTENS = 1  # Newsletters without history score 1 listen in 2 emails
+    AUDIO_DEMAND_PRIOR_EMAILS = 2
+    AUDIO_PRERENDER_THRESHOLD = float(os.environ.get('AUDIO_PRERENDER_THRESHOLD', 0.25))
+    TTS_COST_PER_MILLION_CHARS = 15.0  # Dollars, to report the spend saved by not pre-rendering
+
+    # Text-to-speech segments are synthesized concurrently
+    TTS_MAX_CONCURRENCY = int(os.environ.get('TTS_MAX_CONCURRENCY', 4))
+    TTS_MAX_RETRIES = 2  # Retries per segment after transient API errors
+    TTS_RETRY_BACKOFF = 1  # Seconds before the first retry, doubled on every attempt
+
+    # Content-addressed cache of synthesized speech segments
+    TTS_CACHE_ENABLED = os.environ.get('TTS_CACHE_ENABLED', 'true') == 'true'
+    TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', os.path.join(DATA_DIR, 'tts_cache'))
+    TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+    # Progressive playback of audio that is still being synthesized
+    AUDIO_STREAM_DIR = os.environ.get('AUDIO_STREAM_DIR', os.path.join(DATA_DIR, 'audio_streams'))
+    AUDIO_STREAM_RETENTION = 3600  # Seconds a finished stream is kept for listeners still reading it
+    AUDIO_STREAM_IDLE_TIMEOUT = 30  # Seconds without new audio before a listener gives up
+    AUDIO_STREAM_MAX_DURATION = 600  # Seconds a listener request is kept open at most
+
+    # Browser cache lifetime of audio fetched from versioned URLs
+    AUDIO_CACHE_MAX_AGE = 365 * 24 * 3600
+    # Let the front web server send stored audio: 'x-accel-redirect' (nginx) or 'x-sendfile'
+    # (Apache, lighttpd); empty to send it from Python. With nginx, AUDIO_ACCEL_REDIRECT_PREFIX
+    # must be an `internal` location aliased to AUDIO_STORAGE_DIR.
+    AUDIO_OFFLOAD = os.environ.get('AUDIO_OFFLOAD', '')
+    AUDIO_ACCEL_REDIRECT_PREFIX = os.environ.get('AUDIO_ACCEL_REDIRECT_PREFIX', '/protected-audio/')
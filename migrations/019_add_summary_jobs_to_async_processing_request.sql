@@ -0,0 +1,11 @@
+-- Migration: 019 Add summary generation jobs to async_processing_request
+-- Description: Lets async requests target a pending summary instead of an email,
+--              and records why a request failed
+-- Created: 2026-10-19
+
+ALTER TABLE async_processing_request
+    ALTER COLUMN email_id DROP NOT NULL,
+    ADD COLUMN IF NOT EXISTS summary_id INTEGER REFERENCES summary(id) ON DELETE CASCADE,
+    ADD COLUMN IF NOT EXISTS error_message TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_async_processing_request_summary_id ON async_processing_request(summary_id);
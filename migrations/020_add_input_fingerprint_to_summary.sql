@@ -0,0 +1,9 @@
+-- Migration: 020 Add input_fingerprint to summary
+-- Description: Hash of the emails, extraction and synthesis settings a summary was built from,
+--              used to reuse a synthesis when its inputs have not changed
+-- Created: 2026-10-19
+
+ALTER TABLE summary
+    ADD COLUMN IF NOT EXISTS input_fingerprint VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS idx_summary_input_fingerprint ON summary(input_fingerprint);
@@ -0,0 +1,13 @@
+-- Migration: 021 Move audio_file data to the audio storage backend
+-- Description: audio_file rows reference audio held by the storage backend through its key,
+--              size and sha256 digest; the inline data column becomes optional and is emptied
+--              by the migrate_audio_storage tool
+-- Created: 2026-10-19
+
+ALTER TABLE audio_file
+    ALTER COLUMN data DROP NOT NULL,
+    ADD COLUMN IF NOT EXISTS storage_key VARCHAR(100),
+    ADD COLUMN IF NOT EXISTS size INTEGER,
+    ADD COLUMN IF NOT EXISTS digest VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS idx_audio_file_storage_key ON audio_file(storage_key);
@@ -0,0 +1,18 @@
+-- Migration: 022 Create audio_rendition table
+-- Description: Alternative encodings of an audio file (e.g. a low-bitrate speech variant),
+--              held by the audio storage backend
+-- Created: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS audio_rendition (
+    id SERIAL PRIMARY KEY,
+    audio_file_id INTEGER NOT NULL REFERENCES audio_file(id) ON DELETE CASCADE,
+    name VARCHAR(50) NOT NULL,
+    mimetype VARCHAR(50) NOT NULL,
+    storage_key VARCHAR(100) NOT NULL,
+    size INTEGER NOT NULL,
+    digest VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT unique_audio_rendition UNIQUE (audio_file_id, name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_audio_rendition_audio_file_id ON audio_rendition(audio_file_id);
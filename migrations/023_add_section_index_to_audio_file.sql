@@ -0,0 +1,7 @@
+-- Migration: 023 Add section_index to audio_file
+-- Description: Start and end of each section of the audio, in seconds and bytes, so players
+--              can seek to a section or fetch it alone
+-- Created: 2026-10-19
+
+ALTER TABLE audio_file
+    ADD COLUMN IF NOT EXISTS section_index JSON;
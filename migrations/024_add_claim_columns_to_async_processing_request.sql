@@ -0,0 +1,13 @@
+-- Migration: 024 Add claim columns to async_processing_request
+-- Description: Records which worker claimed a request and when it started and finished,
+--              and indexes pending requests in queue order for SKIP LOCKED claiming
+-- Created: 2026-10-19
+
+ALTER TABLE async_processing_request
+    ADD COLUMN IF NOT EXISTS worker VARCHAR(100),
+    ADD COLUMN IF NOT EXISTS started_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_async_processing_request_pending
+    ON async_processing_request(created_at, id)
+    WHERE status = 'pending';
@@ -0,0 +1,12 @@
+-- Migration: 025 Add lease columns to async_processing_request
+-- Description: Started requests are leased to their worker until lease_expires_at, renewed by
+--              heartbeat; expired requests are requeued until they reach the maximum attempts
+-- Created: 2026-10-19
+
+ALTER TABLE async_processing_request
+    ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_async_processing_request_started_lease
+    ON async_processing_request(lease_expires_at)
+    WHERE status = 'started';
@@ -0,0 +1,13 @@
+-- Migration: 026 Add priority to async_processing_request
+-- Description: Queues requests in a high-priority lane (10, a user is waiting on them) or a
+--              low-priority lane (0, scheduled batch work), and indexes pending requests in claim order
+-- Created: 2026-10-19
+
+ALTER TABLE async_processing_request
+    ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 10;
+
+DROP INDEX IF EXISTS idx_async_processing_request_pending;
+
+CREATE INDEX IF NOT EXISTS idx_async_processing_request_pending
+    ON async_processing_request(priority DESC, created_at, id)
+    WHERE status = 'pending';
@@ -0,0 +1,9 @@
+-- Migration: 027 Add updated_at to audio_file
+-- Description: Records when the audio of a file last changed, since rows are reused when audio
+--              is regenerated; used as Last-Modified of audio responses
+-- Created: 2026-10-19
+
+ALTER TABLE audio_file
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+
+UPDATE audio_file SET updated_at = created_at WHERE updated_at IS NULL;
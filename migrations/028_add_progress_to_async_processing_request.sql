@@ -0,0 +1,7 @@
+-- Migration: 028 Add progress to async_processing_request
+-- Description: Progress events a worker reports while it runs a request, relayed to the
+--              client by /generate-summary/stream
+-- Created: 2026-10-19
+
+ALTER TABLE async_processing_request
+    ADD COLUMN IF NOT EXISTS progress JSON;